@@ -0,0 +1,11 @@
+-- ============================================================
+-- BAA Commission Engine — Schema Migration 004
+-- Indexes for UY-scoped deletes and policy foreign-key checks
+-- Idempotent - safe to run multiple times
+-- ============================================================
+
+-- policies had no index led by underwriting_year
+CREATE INDEX IF NOT EXISTS idx_policies_uy ON policies(underwriting_year);
+
+-- Deleting a policy checks transactions.policy_ref for references
+CREATE INDEX IF NOT EXISTS idx_transactions_policy_ref ON transactions(policy_ref);
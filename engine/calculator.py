@@ -2,9 +2,13 @@
 BAA Profit Commission Calculator.
 Uses pluggable scheme architecture for multiple commission types.
 """
+import json
 from datetime import date
 from dataclasses import dataclass, field
+from functools import cached_property
 from typing import Optional, List, Dict, Any
+
+import numpy as np
 from engine.models import (
     get_connection, get_earned_premium, get_paid_claims,
     get_ibnr, get_carrier_splits, get_prior_commission_paid,
@@ -14,8 +18,9 @@ from engine.schemes import (
     ProfitCommissionScheme, create_scheme, CommissionContext, CommissionResult,
     ProfitCommissionError, MissingSchemeError, CarrierSplitsError,
     NoEarnedPremiumError, NoIBNRSnapshotError, UnknownSchemeTypeError,
-    InvalidSchemeParametersError, SCHEME_REGISTRY
+    InvalidSchemeParametersError, SlidingScaleScheme, SCHEME_REGISTRY
 )
+from engine.schemes_kernels import default_scale_rate
 
 # Constants
 MIN_COMMISSION_RATE = 0.05
@@ -23,6 +28,22 @@ IBNR_STALENESS_DAYS = 90
 ULR_DIVERGENCE_THRESHOLD = 0.10
 
 
+@dataclass(slots=True)
+class CarrierAllocation:
+    """One carrier's share of a true-up."""
+    carrier_id: str
+    carrier_name: str
+    participation_pct: float
+    carrier_gross_commission: float
+    prior_paid: float
+    delta_payment: float
+    scheme_type: str
+    commission_rate: float = 0.0
+    frozen: bool = False
+    floor_guard_applied: bool = False
+    split_effective_from: Optional[date] = None
+
+
 @dataclass
 class TrueUpResult:
     """Result of a commission true-up calculation."""
@@ -36,10 +57,18 @@ class TrueUpResult:
     ultimate_loss_ratio: float
     commission_rate: float
     gross_commission: float
-    carrier_allocations: List[Dict[str, Any]] = field(default_factory=list)
+    carrier_allocations: List[CarrierAllocation] = field(default_factory=list)
     warnings: List[str] = field(default_factory=list)
     floor_guard_applied: bool = False
     scheme_type: str = 'sliding_scale'
+    ledger_ids: Dict[str, int] = field(default_factory=dict)
+    ibnr_stale_days: int = 0
+    ulr_divergence_flag: bool = False
+
+    @cached_property
+    def carrier_allocations_by_id(self) -> Dict[str, CarrierAllocation]:
+        """carrier_allocations keyed by carrier_id, built on first access."""
+        return {a.carrier_id: a for a in self.carrier_allocations}
 
 
 def get_carrier_scheme(conn, underwriting_year: int, carrier_id: str, as_of_date: str) -> tuple:
@@ -97,11 +126,13 @@ def check_lpt_freeze(conn, carrier_id: str, underwriting_year: int, as_of_date:
         return cur.fetchone() is not None
 
 
-def run_trueup(underwriting_year: int, development_month: int, as_of_date: str,
-               calc_type: str = 'true_up', write_to_db: bool = True,
-               allow_negative_commission: bool = False) -> TrueUpResult:
+def compute_trueup(underwriting_year: int, development_month: int, as_of_date: str,
+                   allow_negative_commission: bool = False, conn=None) -> TrueUpResult:
     """
-    Run a commission true-up calculation for a given underwriting year and as-of date.
+    Compute a commission true-up for a given underwriting year and as-of date.
+
+    Read-only: nothing is written to commission_ledger. Pass the result to
+    persist_trueup() to record it, or use run_trueup() to do both.
     
     Uses pluggable scheme architecture - each carrier can have different scheme.
     
@@ -115,9 +146,9 @@ def run_trueup(underwriting_year: int, development_month: int, as_of_date: str,
         underwriting_year: The underwriting year (e.g., 2023)
         development_month: Development month to query IBNR for (e.g., 12, 24, 36)
         as_of_date: Evaluation date (YYYY-MM-DD)
-        calc_type: Type of calculation ('provisional', 'true_up', 'final')
-        write_to_db: Whether to write results to commission_ledger
         allow_negative_commission: Whether to allow negative commission deltas (default: False)
+        conn: Optional open connection. When given, reads run inside the
+            caller's transaction and the connection is not closed here.
     
     Returns:
         TrueUpResult with all calculation details
@@ -127,7 +158,9 @@ def run_trueup(underwriting_year: int, development_month: int, as_of_date: str,
     """
     warnings: List[str] = []
     eval_date = date.fromisoformat(as_of_date)
-    conn = get_connection()
+    owns_conn = conn is None
+    if owns_conn:
+        conn = get_connection()
     try:
         # Get earned premium
         earned_premium = get_earned_premium(conn, underwriting_year, as_of_date)
@@ -173,10 +206,14 @@ def run_trueup(underwriting_year: int, development_month: int, as_of_date: str,
             raise CarrierSplitsError(f'No carrier splits for UY {underwriting_year}')
 
         floor_guard_applied = False
-        carrier_allocations: List[Dict[str, Any]] = []
+        carrier_allocations: List[CarrierAllocation] = []
         total_gross = 0.0
         scheme_type_used = None
 
+        # Resolve every carrier's scheme and context first. Frozen carriers
+        # get their allocation now; the rest are indexes into `pending`.
+        pending = []
+        entries = []
         for carrier in carrier_splits:
             cid = carrier['carrier_id']
             pct = float(carrier['participation_pct'])
@@ -184,16 +221,16 @@ def run_trueup(underwriting_year: int, development_month: int, as_of_date: str,
             # Check for LPT freeze
             if check_lpt_freeze(conn, cid, underwriting_year, as_of_date):
                 warnings.append(f'WARNING: Commission frozen for {cid} due to LPT')
-                carrier_allocations.append({
-                    'carrier_id': cid,
-                    'carrier_name': carrier['carrier_name'],
-                    'participation_pct': pct,
-                    'carrier_gross_commission': 0,
-                    'prior_paid': 0,
-                    'delta_payment': 0,
-                    'frozen': True,
-                    'scheme_type': 'lpt_frozen',
-                })
+                entries.append(CarrierAllocation(
+                    carrier_id=cid,
+                    carrier_name=carrier['carrier_name'],
+                    participation_pct=pct,
+                    carrier_gross_commission=0,
+                    prior_paid=0,
+                    delta_payment=0,
+                    scheme_type='lpt_frozen',
+                    frozen=True,
+                ))
                 continue
 
             # Get carrier-specific scheme
@@ -219,60 +256,61 @@ def run_trueup(underwriting_year: int, development_month: int, as_of_date: str,
                 prior_paid=get_prior_commission_paid(conn, underwriting_year, cid),
                 carrier_pct=pct,
                 underwriting_year=underwriting_year,
-                as_of_date=as_of_date,
+                as_of_date=eval_date,
                 development_month=actual_dev_month,
                 allow_negative_commission=scheme_allow_negative,
             )
+            entries.append(len(pending))
+            pending.append((carrier, scheme_type, scheme, scheme_params, context))
 
-            # Compute commission using scheme
+        # Compute carriers that share a scheme and parameters in one call
+        groups: Dict[tuple, List[int]] = {}
+        for i, (_, _, scheme, scheme_params, _) in enumerate(pending):
+            key = (id(scheme), json.dumps(scheme_params, sort_keys=True, default=str))
+            groups.setdefault(key, []).append(i)
+
+        results: List[Optional[CommissionResult]] = [None] * len(pending)
+        for indexes in groups.values():
+            _, _, scheme, scheme_params, _ = pending[indexes[0]]
+            contexts = [pending[i][4] for i in indexes]
             try:
-                result = scheme.compute_commission(context, scheme_params)
+                group_results = scheme.compute_commissions(contexts, scheme_params)
             except InvalidSchemeParametersError as e:
-                warnings.append(f'WARNING: Invalid params for {cid}: {e}, using defaults')
-                scheme = create_scheme('sliding_scale')
-                result = scheme.compute_commission(context, {'min_commission_rate': MIN_COMMISSION_RATE})
+                for i in indexes:
+                    warnings.append(f'WARNING: Invalid params for {pending[i][0]["carrier_id"]}: {e}, using defaults')
+                group_results = create_scheme('sliding_scale').compute_commissions(
+                    contexts, {'min_commission_rate': MIN_COMMISSION_RATE}
+                )
+            for i, result in zip(indexes, group_results):
+                results[i] = result
+
+        for entry in entries:
+            if isinstance(entry, CarrierAllocation):
+                carrier_allocations.append(entry)
+                continue
+
+            carrier, scheme_type, _, _, context = pending[entry]
+            result = results[entry]
+            cid = carrier['carrier_id']
+            pct = context.carrier_pct
 
             if result.floor_guard_applied:
                 floor_guard_applied = True
             
             total_gross += result.gross_commission * pct
             
-            carrier_allocations.append({
-                'carrier_id': cid,
-                'carrier_name': carrier['carrier_name'],
-                'participation_pct': pct,
-                'carrier_gross_commission': result.gross_commission * pct,
-                'prior_paid': context.prior_paid,
-                'delta_payment': result.delta_payment,
-                'scheme_type': scheme_type,
-                'commission_rate': result.commission_rate,
-            })
-
-            if write_to_db:
-                # Determine staleness and divergence flags
-                ulr_div = abs(ulr - mgu_ulr) > ULR_DIVERGENCE_THRESHOLD
-                
-                write_commission_record(conn, {
-                    'underwriting_year': underwriting_year,
-                    'carrier_id': cid,
-                    'development_month': actual_dev_month,
-                    'as_of_date': as_of_date,
-                    'earned_premium': round(earned_premium * pct, 2),
-                    'paid_claims': round(paid_claims * pct, 2),
-                    'ibnr_amount': round(ibnr_carrier * pct, 2),
-                    'ultimate_loss_ratio': round(ulr, 6),
-                    'commission_rate': result.commission_rate,
-                    'gross_commission': round(result.gross_commission * pct, 2),
-                    'prior_paid_total': round(context.prior_paid, 2),
-                    'delta_payment': round(result.delta_payment, 2),
-                    'floor_guard_applied': result.floor_guard_applied,
-                    'calc_type': calc_type,
-                    'carrier_split_effective_from': carrier.get('effective_from'),
-                    'carrier_split_pct': pct,
-                    'ibnr_stale_days': days_stale if days_stale > 0 else 0,
-                    'ulr_divergence_flag': ulr_div,
-                    'scheme_type_used': scheme_type,
-                })
+            carrier_allocations.append(CarrierAllocation(
+                carrier_id=cid,
+                carrier_name=carrier['carrier_name'],
+                participation_pct=pct,
+                carrier_gross_commission=result.gross_commission * pct,
+                prior_paid=context.prior_paid,
+                delta_payment=result.delta_payment,
+                scheme_type=scheme_type,
+                commission_rate=result.commission_rate,
+                floor_guard_applied=result.floor_guard_applied,
+                split_effective_from=carrier.get('effective_from'),
+            ))
 
         # Compute effective commission rate (total gross / earned premium)
         effective_rate = total_gross / earned_premium if earned_premium > 0 else 0.0
@@ -292,15 +330,106 @@ def run_trueup(underwriting_year: int, development_month: int, as_of_date: str,
             warnings=warnings,
             floor_guard_applied=floor_guard_applied,
             scheme_type=scheme_type_used or 'sliding_scale',
+            ibnr_stale_days=days_stale if days_stale > 0 else 0,
+            ulr_divergence_flag=abs(ulr - mgu_ulr) > ULR_DIVERGENCE_THRESHOLD,
         )
     finally:
-        conn.close()
+        if owns_conn:
+            conn.close()
+
+
+def persist_trueup(conn, result: TrueUpResult, calc_type: str = 'true_up') -> Dict[str, int]:
+    """
+    Write one commission_ledger row per non-frozen carrier in a computed true-up.
+
+    Does not commit. Fills result.ledger_ids and returns it.
+    """
+    for alloc in result.carrier_allocations:
+        if alloc.frozen:
+            continue
+        pct = alloc.participation_pct
+        result.ledger_ids[alloc.carrier_id] = write_commission_record(conn, {
+            'underwriting_year': result.underwriting_year,
+            'carrier_id': alloc.carrier_id,
+            'development_month': result.development_month,
+            'as_of_date': result.as_of_date,
+            'earned_premium': round(result.earned_premium * pct, 2),
+            'paid_claims': round(result.paid_claims * pct, 2),
+            'ibnr_amount': round(result.ibnr_carrier * pct, 2),
+            'ultimate_loss_ratio': round(result.ultimate_loss_ratio, 6),
+            'commission_rate': alloc.commission_rate,
+            'gross_commission': round(alloc.carrier_gross_commission, 2),
+            'prior_paid_total': round(alloc.prior_paid, 2),
+            'delta_payment': round(alloc.delta_payment, 2),
+            'floor_guard_applied': alloc.floor_guard_applied,
+            'calc_type': calc_type,
+            'carrier_split_effective_from': alloc.split_effective_from,
+            'carrier_split_pct': pct,
+            'ibnr_stale_days': result.ibnr_stale_days,
+            'ulr_divergence_flag': result.ulr_divergence_flag,
+            'scheme_type_used': alloc.scheme_type,
+        })
+    return result.ledger_ids
+
+
+def run_trueup(underwriting_year: int, development_month: int, as_of_date: str,
+               calc_type: str = 'true_up', write_to_db: bool = True,
+               allow_negative_commission: bool = False, conn=None) -> TrueUpResult:
+    """
+    Compute a true-up and, unless write_to_db is False, record it in the ledger.
+
+    See compute_trueup() for the calculation and persist_trueup() for the
+    ledger write.
+
+    Args:
+        underwriting_year: The underwriting year (e.g., 2023)
+        development_month: Development month to query IBNR for (e.g., 12, 24, 36)
+        as_of_date: Evaluation date (YYYY-MM-DD)
+        calc_type: Type of calculation ('provisional', 'true_up', 'final')
+        write_to_db: Whether to write results to commission_ledger
+        allow_negative_commission: Whether to allow negative commission deltas (default: False)
+        conn: Optional open connection. When given, the true-up runs inside the
+            caller's transaction and is neither committed nor closed here.
+
+    Returns:
+        TrueUpResult with all calculation details
+
+    Raises:
+        ProfitCommissionError: On various error conditions
+    """
+    owns_conn = conn is None
+    if owns_conn:
+        conn = get_connection()
+    try:
+        result = compute_trueup(underwriting_year, development_month, as_of_date,
+                                allow_negative_commission=allow_negative_commission, conn=conn)
+        if write_to_db:
+            persist_trueup(conn, result, calc_type)
+            if owns_conn:
+                conn.commit()
+        return result
+    finally:
+        if owns_conn:
+            conn.close()
+
+
+def get_commission_rates(loss_ratios) -> np.ndarray:
+    """Default sliding-scale rate for each loss ratio in an array.
+
+    Vectorised counterpart of get_commission_rate() without custom bands.
+    """
+    return SlidingScaleScheme.band_rates(loss_ratios)
 
 
 # Export for backward compatibility
 def get_commission_rate(loss_ratio: float, scheme_params: Optional[Dict] = None) -> float:
-    """Legacy function for backward compatibility."""
-    from engine.schemes import SlidingScaleScheme
+    """Legacy function for backward compatibility.
+
+    Without custom bands the rate comes straight from the compiled default
+    scale; otherwise it goes through SlidingScaleScheme.
+    """
+    if not scheme_params or 'bands' not in scheme_params:
+        return float(default_scale_rate(float(loss_ratio)))
     scheme = SlidingScaleScheme()
     result = scheme.compute_commission(
         CommissionContext(
@@ -310,7 +439,7 @@ def get_commission_rate(loss_ratio: float, scheme_params: Optional[Dict] = None)
             prior_paid=0,
             carrier_pct=1.0,
             underwriting_year=2024,
-            as_of_date='2025-01-01',
+            as_of_date=date(2025, 1, 1),
             development_month=12,
         ),
         scheme_params or {}
@@ -3,6 +3,7 @@ Database connection and core query functions.
 All queries use parameterised inputs.
 Connects to Postgres at hostname 'db' (the Docker service name).
 """
+import math
 import os
 from datetime import date
 from typing import Optional, List, Dict, Any
@@ -197,7 +198,7 @@ def get_carrier_splits(conn, underwriting_year: int,
             raise CarrierSplitsError(f'No carrier splits found for UY={underwriting_year} as_of={as_of_date}')
         splits = [dict(r) for r in rows]
         total_pct = sum(float(s['participation_pct']) for s in splits)
-        if abs(total_pct - 1.0) > 0.0001:
+        if not math.isclose(total_pct, 1.0, abs_tol=0.0001):
             raise CarrierSplitsError(f'Carrier splits for UY={underwriting_year} as_of={as_of_date} sum to {total_pct}, expected 1.0')
         return splits
 
@@ -223,7 +224,7 @@ def get_prior_commission_paid(conn, underwriting_year: int, carrier_id: str) ->
         return float(cur.fetchone()['total'])
 
 
-def write_commission_record(conn, record: Dict[str, Any]) -> None:
+def write_commission_record(conn, record: Dict[str, Any]) -> int:
     """
     Write a commission calculation record to the ledger.
     
@@ -233,10 +234,15 @@ def write_commission_record(conn, record: Dict[str, Any]) -> None:
     - ibnr_stale_days: days since IBNR snapshot was created
     - ulr_divergence_flag: whether carrier vs MGU ULR diverged >10%
     - scheme_type_used: which commission scheme was applied
+
+    Does not commit; the caller owns the transaction.
     
     Args:
         conn: Database connection
         record: Dict containing all commission fields
+
+    Returns:
+        id of the inserted commission_ledger row
     """
     with conn.cursor() as cur:
         cur.execute("""
@@ -255,5 +261,7 @@ def write_commission_record(conn, record: Dict[str, Any]) -> None:
                 %(calc_type)s, %(carrier_split_effective_from)s, %(carrier_split_pct)s,
                 %(ibnr_stale_days)s, %(ulr_divergence_flag)s, %(scheme_type_used)s
             )
+            RETURNING id
         """, record)
-    conn.commit()
+        ledger_id = cur.fetchone()['id']
+    return ledger_id
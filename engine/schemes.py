@@ -2,11 +2,20 @@
 BAA Profit Commission Engine.
 Modular, pluggable architecture for multiple profit commission scheme types.
 """
+import math
 from abc import ABC, abstractmethod
+from operator import itemgetter
 from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Any
 from datetime import date
 
+import numpy as np
+
+from engine.schemes_kernels import (
+    HAVE_NUMBA, sliding_scale_kernel, sliding_scale_batch_kernel,
+    capped_scale_kernel, fixed_plus_variable_kernel, corridor_kernel
+)
+
 
 # =============================================================================
 # Domain Exceptions
@@ -51,23 +60,28 @@ class NoIBNRSnapshotError(ProfitCommissionError):
 # Scheme Base Class and Subclasses
 # =============================================================================
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CommissionContext:
-    """Context passed to scheme compute_commission method."""
+    """Context passed to scheme compute_commission method. Immutable."""
     earned_premium: float
     paid_claims: float
     ibnr: float
     prior_paid: float
     carrier_pct: float
     underwriting_year: int
-    as_of_date: str
+    as_of_date: date
     development_month: int
     allow_negative_commission: bool = False
 
+    def __post_init__(self):
+        # Accept ISO strings, but parse them once here rather than per compute
+        if isinstance(self.as_of_date, str):
+            object.__setattr__(self, 'as_of_date', date.fromisoformat(self.as_of_date))
 
-@dataclass
+
+@dataclass(slots=True)
 class CommissionResult:
-    """Result from computing commission."""
+    """Result from computing commission. One is built per carrier, hence slots."""
     commission_rate: float
     gross_commission: float
     delta_payment: float
@@ -75,6 +89,34 @@ class CommissionResult:
     warnings: List[str] = field(default_factory=list)
 
 
+@dataclass
+class CommissionBatchResult:
+    """Element-wise results from computing commission over arrays of contexts."""
+    commission_rate: np.ndarray
+    gross_commission: np.ndarray
+    delta_payment: np.ndarray
+    floor_guard_applied: np.ndarray
+
+
+def _kernel_result(values) -> CommissionResult:
+    """Wrap a (rate, gross, delta, floor_applied) tuple from schemes_kernels."""
+    rate, gross, delta, floor_applied = values
+    return CommissionResult(
+        commission_rate=rate,
+        gross_commission=gross,
+        delta_payment=delta,
+        floor_guard_applied=floor_applied
+    )
+
+
+def _required_params(params: Dict, getter: itemgetter):
+    """Fetch required scheme parameters in one call, or raise InvalidSchemeParametersError."""
+    try:
+        return getter(params)
+    except KeyError as e:
+        raise InvalidSchemeParametersError(f"Missing required parameter: {e.args[0]}") from None
+
+
 class ProfitCommissionScheme(ABC):
     """Base class for all profit commission schemes."""
     
@@ -93,6 +135,15 @@ class ProfitCommissionScheme(ABC):
             CommissionResult with calculated values
         """
         raise NotImplementedError
+
+    def compute_commissions(self, contexts: List[CommissionContext], params: Dict) -> List[CommissionResult]:
+        """
+        Compute commission for several contexts that share the same params.
+
+        Schemes with a vectorised path override this; the default computes
+        each context in turn.
+        """
+        return [self.compute_commission(context, params) for context in contexts]
     
     def validate_params(self, params: Dict) -> None:
         """Validate scheme parameters. Raise InvalidSchemeParametersError if invalid."""
@@ -112,10 +163,40 @@ class SlidingScaleScheme(ProfitCommissionScheme):
         (1.00, 0.00),
         (999, 0.00),
     ]
+
+    # DEFAULT_BANDS as arrays for searchsorted; the trailing rate covers
+    # loss ratios past the last edge
+    _DEFAULT_EDGES = np.array([lr_max for lr_max, _ in DEFAULT_BANDS])
+    _DEFAULT_RATES = np.array([rate for _, rate in DEFAULT_BANDS] + [0.0])
+
+    @classmethod
+    def band_rates(cls, ulr, bands=None) -> np.ndarray:
+        """Rate of the first band with ulr < lr_max, for each element of ulr."""
+        ulr = np.asarray(ulr, dtype=np.float64)
+        if bands is None:
+            edges, rates = cls._DEFAULT_EDGES, cls._DEFAULT_RATES
+        else:
+            edges = np.array([lr_max for lr_max, _ in bands], dtype=np.float64)
+            rates = np.array([rate for _, rate in bands] + [0.0], dtype=np.float64)
+            if np.any(np.diff(edges) <= 0):
+                # Unsorted bands: first match wins, so fill from the last band back
+                commission_rate = np.zeros_like(ulr)
+                for lr_max, rate in reversed(bands):
+                    commission_rate = np.where(ulr < lr_max, rate, commission_rate)
+                return commission_rate
+        return rates[np.searchsorted(edges, ulr, side='right')]
     
     def compute_commission(self, context: CommissionContext, params: Dict) -> CommissionResult:
-        # Get bands from params or use default
-        bands = params.get('bands', self.DEFAULT_BANDS)
+        # Default bands go through the compiled kernel
+        if 'bands' not in params:
+            return _kernel_result(sliding_scale_kernel(
+                context.earned_premium, context.paid_claims, context.ibnr,
+                context.prior_paid, context.carrier_pct,
+                float(params.get('min_commission_rate', 0.05)),
+                context.allow_negative_commission,
+            ))
+
+        bands = params['bands']
         
         # Calculate ULR
         ulr = (context.paid_claims + context.ibnr) / context.earned_premium
@@ -154,116 +235,146 @@ class SlidingScaleScheme(ProfitCommissionScheme):
             floor_guard_applied=floor_guard_applied
         )
 
+    def compute_commissions(self, contexts: List[CommissionContext], params: Dict) -> List[CommissionResult]:
+        if len(contexts) == 1:
+            return [self.compute_commission(contexts[0], params)]
+
+        batch = self.compute_commission_batch(
+            [c.earned_premium for c in contexts],
+            [c.paid_claims for c in contexts],
+            [c.ibnr for c in contexts],
+            [c.prior_paid for c in contexts],
+            [c.carrier_pct for c in contexts],
+            params,
+            [c.allow_negative_commission for c in contexts],
+        )
+        return [
+            CommissionResult(
+                commission_rate=rate,
+                gross_commission=gross,
+                delta_payment=delta,
+                floor_guard_applied=floor_applied,
+            )
+            for rate, gross, delta, floor_applied in zip(
+                batch.commission_rate.tolist(), batch.gross_commission.tolist(),
+                batch.delta_payment.tolist(), batch.floor_guard_applied.tolist(),
+            )
+        ]
+
+    def compute_commission_batch(self, earned_premium, paid_claims, ibnr, prior_paid,
+                                 carrier_pct, params: Dict,
+                                 allow_negative_commission=False) -> CommissionBatchResult:
+        """
+        Vectorised compute_commission over arrays of context fields.
+
+        Array arguments broadcast against each other; element i of the
+        result matches compute_commission for the i-th context.
+        """
+        earned_premium = np.asarray(earned_premium, dtype=np.float64)
+        prior_paid = np.asarray(prior_paid, dtype=np.float64)
+        carrier_pct = np.asarray(carrier_pct, dtype=np.float64)
+        allow_negative = np.asarray(allow_negative_commission, dtype=bool)
+        min_rate = params.get('min_commission_rate', 0.05)
+
+        if HAVE_NUMBA and 'bands' not in params:
+            # Default bands: one parallel compiled pass over flat arrays
+            arrays = np.broadcast_arrays(
+                earned_premium, np.asarray(paid_claims, dtype=np.float64),
+                np.asarray(ibnr, dtype=np.float64), prior_paid, carrier_pct, allow_negative,
+            )
+            shape = arrays[0].shape
+            flat = [np.ascontiguousarray(a).ravel() for a in arrays]
+            rate, gross, delta, floor_applied = sliding_scale_batch_kernel(
+                *flat[:5], float(min_rate), flat[5]
+            )
+            return CommissionBatchResult(
+                commission_rate=rate.reshape(shape),
+                gross_commission=gross.reshape(shape),
+                delta_payment=delta.reshape(shape),
+                floor_guard_applied=floor_applied.reshape(shape),
+            )
+
+        ulr = (np.asarray(paid_claims, dtype=np.float64) + ibnr) / earned_premium
+        commission_rate = self.band_rates(ulr, params.get('bands'))
+
+        gross_commission = earned_premium * commission_rate
+        carrier_gross = gross_commission * carrier_pct
+
+        minimum_commission = earned_premium * min_rate * carrier_pct
+
+        delta = carrier_gross - prior_paid
+        delta = np.where(~allow_negative & (delta < 0), 0.0, delta)
+        floor_guard_applied = ~allow_negative & (prior_paid + delta < minimum_commission)
+        delta = np.where(floor_guard_applied, minimum_commission - prior_paid, delta)
+
+        return CommissionBatchResult(
+            commission_rate=commission_rate,
+            gross_commission=gross_commission,
+            delta_payment=delta,
+            floor_guard_applied=floor_guard_applied,
+        )
+
 
 class FixedPlusVariableScheme(ProfitCommissionScheme):
     """Fixed + Variable profit commission scheme."""
     
     SCHEME_TYPE = "fixed_plus_variable"
+
+    _REQUIRED = itemgetter('fixed_rate')
     
     def validate_params(self, params: Dict) -> None:
-        required = ['fixed_rate']
-        for field in required:
-            if field not in params:
-                raise InvalidSchemeParametersError(f"Missing required parameter: {field}")
+        _required_params(params, self._REQUIRED)
     
     def compute_commission(self, context: CommissionContext, params: Dict) -> CommissionResult:
-        self.validate_params(params)
-        
-        # Get parameters
-        fixed_rate = params.get('fixed_rate', 0.10)
-        variable_rate = params.get('variable_rate', 0.15)
-        profit_threshold = params.get('profit_threshold', 0.0)
+        fixed_rate = _required_params(params, self._REQUIRED)
         variable_cap = params.get('variable_cap', None)  # Optional cap
-        
-        # Calculate underwriting profit
-        total_loss = context.paid_claims + context.ibnr
-        underwriting_profit = context.earned_premium - total_loss
-        profit_margin = underwriting_profit / context.earned_premium if context.earned_premium > 0 else 0
-        
-        # Fixed commission
-        fixed_commission = context.earned_premium * fixed_rate * context.carrier_pct
-        
-        # Variable commission (profit share)
-        variable_commission = 0.0
-        if profit_margin > profit_threshold:
-            # Profit above threshold is shared
-            profit_above_threshold = (profit_margin - profit_threshold) * context.earned_premium
-            variable_commission = profit_above_threshold * variable_rate * context.carrier_pct
-        
-        # Apply cap if specified
-        if variable_cap is not None:
-            variable_cap_amount = context.earned_premium * variable_cap * context.carrier_pct
-            variable_commission = min(variable_commission, variable_cap_amount)
-        
-        gross_commission = fixed_commission + variable_commission
-        
-        # Apply floor guard
-        min_rate = params.get('min_commission_rate', 0.05)
-        minimum_commission = context.earned_premium * min_rate * context.carrier_pct
-        floor_guard_applied = False
-        
-        delta = gross_commission - context.prior_paid
-        if context.prior_paid + delta < minimum_commission:
-            delta = minimum_commission - context.prior_paid
-            floor_guard_applied = True
-        
-        return CommissionResult(
-            commission_rate=(fixed_rate + variable_commission / context.earned_premium) if context.earned_premium > 0 else 0,
-            gross_commission=fixed_commission + variable_commission,
-            delta_payment=delta,
-            floor_guard_applied=floor_guard_applied
-        )
+        return _kernel_result(fixed_plus_variable_kernel(
+            context.earned_premium, context.paid_claims, context.ibnr,
+            context.prior_paid, context.carrier_pct,
+            float(fixed_rate),
+            float(params.get('variable_rate', 0.15)),
+            float(params.get('profit_threshold', 0.0)),
+            math.nan if variable_cap is None else float(variable_cap),
+            float(params.get('min_commission_rate', 0.05)),
+        ))
 
 
 class CorridorProfitScheme(ProfitCommissionScheme):
     """Corridor-based profit share scheme."""
     
     SCHEME_TYPE = "corridor"
+
+    _REQUIRED = itemgetter('corridor_min', 'corridor_max', 'rate_inside', 'rate_outside')
     
     def validate_params(self, params: Dict) -> None:
-        required = ['corridor_min', 'corridor_max', 'rate_inside', 'rate_outside']
-        for field in required:
-            if field not in params:
-                raise InvalidSchemeParametersError(f"Missing required parameter: {field}")
+        _required_params(params, self._REQUIRED)
     
-    def compute_commission(self, context: CommissionContext, params: Dict) -> CommissionResult:
-        self.validate_params(params)
-        
-        # Get parameters
-        corridor_min = params.get('corridor_min', 0.0)
-        corridor_max = params.get('corridor_max', 0.0)
-        rate_inside = params.get('rate_inside', 0.25)
-        rate_outside = params.get('rate_outside', 0.0)
-        
-        # Calculate ULR
-        ulr = (context.paid_claims + context.ibnr) / context.earned_premium
-        
-        # Determine if inside or outside corridor
-        if corridor_min <= ulr <= corridor_max:
-            commission_rate = rate_inside
-        else:
-            commission_rate = rate_outside
-        
-        gross_commission = context.earned_premium * commission_rate
-        carrier_gross = gross_commission * context.carrier_pct
-        
-        # Apply floor guard
-        min_rate = params.get('min_commission_rate', 0.05)
-        minimum_commission = context.earned_premium * min_rate * context.carrier_pct
-        floor_guard_applied = False
-        
-        delta = carrier_gross - context.prior_paid
-        if context.prior_paid + delta < minimum_commission:
-            delta = minimum_commission - context.prior_paid
-            floor_guard_applied = True
-        
-        return CommissionResult(
-            commission_rate=commission_rate,
-            gross_commission=gross_commission,
-            delta_payment=delta,
-            floor_guard_applied=floor_guard_applied
+    def _corridor_args(self, params: Dict) -> tuple:
+        """Validated corridor bounds, rates and floor rate as kernel arguments."""
+        corridor_min, corridor_max, rate_inside, rate_outside = _required_params(params, self._REQUIRED)
+        return (
+            float(corridor_min), float(corridor_max),
+            float(rate_inside), float(rate_outside),
+            float(params.get('min_commission_rate', 0.05)),
         )
 
+    def compute_commission(self, context: CommissionContext, params: Dict) -> CommissionResult:
+        return _kernel_result(corridor_kernel(
+            context.earned_premium, context.paid_claims, context.ibnr,
+            context.prior_paid, context.carrier_pct,
+            *self._corridor_args(params),
+        ))
+
+    def compute_commissions(self, contexts: List[CommissionContext], params: Dict) -> List[CommissionResult]:
+        # Carriers in a group share params, so validate and convert them once
+        args = self._corridor_args(params)
+        return [
+            _kernel_result(corridor_kernel(
+                c.earned_premium, c.paid_claims, c.ibnr, c.prior_paid, c.carrier_pct, *args
+            ))
+            for c in contexts
+        ]
+
 
 class CappedScaleScheme(ProfitCommissionScheme):
     """Capped sliding scale scheme."""
@@ -271,8 +382,17 @@ class CappedScaleScheme(ProfitCommissionScheme):
     SCHEME_TYPE = "capped_scale"
     
     def compute_commission(self, context: CommissionContext, params: Dict) -> CommissionResult:
+        if 'bands' not in params:
+            return _kernel_result(capped_scale_kernel(
+                context.earned_premium, context.paid_claims, context.ibnr,
+                context.prior_paid, context.carrier_pct,
+                float(params.get('min_commission_rate', 0.05)),
+                float(params.get('max_commission_rate', 0.25)),
+                context.allow_negative_commission,
+            ))
+
         # Use sliding scale first
-        sliding = SlidingScaleScheme()
+        sliding = create_scheme(SlidingScaleScheme.SCHEME_TYPE)
         result = sliding.compute_commission(context, params)
         
         # Apply cap
@@ -312,9 +432,19 @@ def get_scheme_class(scheme_type: str) -> type:
     return SCHEME_REGISTRY[scheme_type]
 
 
+# Schemes hold no per-calculation state, so one shared instance per type
+_SCHEME_INSTANCES: Dict[str, ProfitCommissionScheme] = {
+    name: cls() for name, cls in SCHEME_REGISTRY.items()
+}
+
+
 def create_scheme(scheme_type: str) -> ProfitCommissionScheme:
-    """Factory function to create a scheme instance."""
-    return get_scheme_class(scheme_type)()
+    """Factory function returning the shared scheme instance for a type."""
+    scheme = _SCHEME_INSTANCES.get(scheme_type)
+    if scheme is None:
+        # Types registered after import are instantiated on first use
+        scheme = _SCHEME_INSTANCES[scheme_type] = get_scheme_class(scheme_type)()
+    return scheme
 
 
 # =============================================================================
@@ -347,7 +477,7 @@ def get_scheme_rate(scheme_type: str, loss_ratio: float,
         prior_paid=0,
         carrier_pct=1.0,
         underwriting_year=2024,
-        as_of_date='2025-01-01',
+        as_of_date=date(2025, 1, 1),
         development_month=12,
     )
     result = scheme.compute_commission(ctx, scheme_params)
@@ -0,0 +1,182 @@
+"""
+Compiled numeric kernels for the profit commission schemes.
+Uses numba when installed; otherwise the same functions run as plain Python.
+Kernels are compiled with nogil, so true-ups on separate threads (one
+connection each) compute concurrently.
+"""
+import math
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:  # numba is optional; the kernels below run as plain Python
+    HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(nogil=True, cache=True)
+def default_scale_rate(loss_ratio):
+    """Commission rate on the default sliding scale (SlidingScaleScheme.DEFAULT_BANDS)."""
+    if loss_ratio < 0.45:
+        return 0.27
+    if loss_ratio < 0.55:
+        return 0.23
+    if loss_ratio < 0.65:
+        return 0.18
+    if loss_ratio < 0.75:
+        return 0.10
+    return 0.0
+
+
+@njit(nogil=True, cache=True)
+def sliding_scale_kernel(earned_premium, paid_claims, ibnr, prior_paid,
+                         carrier_pct, min_rate, allow_negative):
+    """
+    Default-band sliding scale for one carrier.
+
+    Returns (commission_rate, gross_commission, delta_payment, floor_guard_applied),
+    the same values SlidingScaleScheme.compute_commission puts in its result.
+    """
+    ulr = (paid_claims + ibnr) / earned_premium
+    commission_rate = default_scale_rate(ulr)
+
+    gross_commission = earned_premium * commission_rate
+    carrier_gross = gross_commission * carrier_pct
+    minimum_commission = earned_premium * min_rate * carrier_pct
+
+    delta = carrier_gross - prior_paid
+    floor_guard_applied = False
+    if not allow_negative:
+        if delta < 0:
+            delta = 0.0
+        if prior_paid + delta < minimum_commission:
+            delta = minimum_commission - prior_paid
+            floor_guard_applied = True
+
+    return commission_rate, gross_commission, delta, floor_guard_applied
+
+
+@njit(nogil=True, parallel=True, cache=True)
+def sliding_scale_batch_kernel(earned_premium, paid_claims, ibnr, prior_paid,
+                               carrier_pct, min_rate, allow_negative):
+    """
+    sliding_scale_kernel over 1-D arrays, one carrier per element.
+
+    Elements are independent, so numba spreads them across threads.
+    """
+    n = earned_premium.shape[0]
+    commission_rate = np.empty(n)
+    gross_commission = np.empty(n)
+    delta = np.empty(n)
+    floor_guard_applied = np.empty(n, dtype=np.bool_)
+    for i in prange(n):
+        result = sliding_scale_kernel(
+            earned_premium[i], paid_claims[i], ibnr[i], prior_paid[i],
+            carrier_pct[i], min_rate, allow_negative[i],
+        )
+        commission_rate[i] = result[0]
+        gross_commission[i] = result[1]
+        delta[i] = result[2]
+        floor_guard_applied[i] = result[3]
+    return commission_rate, gross_commission, delta, floor_guard_applied
+
+
+@njit(nogil=True, cache=True)
+def capped_scale_kernel(earned_premium, paid_claims, ibnr, prior_paid,
+                        carrier_pct, min_rate, max_rate, allow_negative):
+    """Default-band sliding scale with the rate capped at max_rate (CappedScaleScheme)."""
+    commission_rate, gross_commission, delta, floor_guard_applied = sliding_scale_kernel(
+        earned_premium, paid_claims, ibnr, prior_paid, carrier_pct, min_rate, allow_negative
+    )
+    if commission_rate > max_rate:
+        commission_rate = max_rate
+        gross_commission = earned_premium * max_rate
+        carrier_gross = gross_commission * carrier_pct
+        minimum_commission = earned_premium * min_rate * carrier_pct
+        delta = carrier_gross - prior_paid
+        if prior_paid + delta < minimum_commission:
+            delta = minimum_commission - prior_paid
+            floor_guard_applied = True
+
+    return commission_rate, gross_commission, delta, floor_guard_applied
+
+
+@njit(nogil=True, cache=True)
+def fixed_plus_variable_kernel(earned_premium, paid_claims, ibnr, prior_paid, carrier_pct,
+                               fixed_rate, variable_rate, profit_threshold, variable_cap,
+                               min_rate):
+    """
+    Fixed commission plus a share of profit above a threshold (FixedPlusVariableScheme).
+
+    variable_cap is NaN when the variable component is uncapped.
+    """
+    total_loss = paid_claims + ibnr
+    underwriting_profit = earned_premium - total_loss
+    profit_margin = underwriting_profit / earned_premium if earned_premium > 0 else 0.0
+
+    fixed_commission = earned_premium * fixed_rate * carrier_pct
+
+    variable_commission = 0.0
+    if profit_margin > profit_threshold:
+        profit_above_threshold = (profit_margin - profit_threshold) * earned_premium
+        variable_commission = profit_above_threshold * variable_rate * carrier_pct
+
+    if not math.isnan(variable_cap):
+        variable_cap_amount = earned_premium * variable_cap * carrier_pct
+        variable_commission = min(variable_commission, variable_cap_amount)
+
+    gross_commission = fixed_commission + variable_commission
+    minimum_commission = earned_premium * min_rate * carrier_pct
+
+    delta = gross_commission - prior_paid
+    floor_guard_applied = False
+    if prior_paid + delta < minimum_commission:
+        delta = minimum_commission - prior_paid
+        floor_guard_applied = True
+
+    commission_rate = (fixed_rate + variable_commission / earned_premium) if earned_premium > 0 else 0.0
+    return commission_rate, gross_commission, delta, floor_guard_applied
+
+
+@njit(nogil=True, cache=True)
+def corridor_kernel(earned_premium, paid_claims, ibnr, prior_paid, carrier_pct,
+                    corridor_min, corridor_max, rate_inside, rate_outside, min_rate):
+    """Rate depends on whether the loss ratio falls inside the corridor (CorridorProfitScheme)."""
+    ulr = (paid_claims + ibnr) / earned_premium
+    if corridor_min <= ulr <= corridor_max:
+        commission_rate = rate_inside
+    else:
+        commission_rate = rate_outside
+
+    gross_commission = earned_premium * commission_rate
+    carrier_gross = gross_commission * carrier_pct
+    minimum_commission = earned_premium * min_rate * carrier_pct
+
+    delta = carrier_gross - prior_paid
+    floor_guard_applied = False
+    if prior_paid + delta < minimum_commission:
+        delta = minimum_commission - prior_paid
+        floor_guard_applied = True
+
+    return commission_rate, gross_commission, delta, floor_guard_applied
+
+
+def warm_up() -> None:
+    """
+    Compile every kernel for float arguments, or load it from numba's on-disk
+    cache, so the first true-up does not pay the JIT cost.
+    """
+    sliding_scale_kernel(100000.0, 10000.0, 5000.0, 0.0, 1.0, 0.05, False)
+    one = np.ones(1)
+    sliding_scale_batch_kernel(one, one, one, one, one, 0.05, np.zeros(1, dtype=np.bool_))
+    capped_scale_kernel(100000.0, 10000.0, 5000.0, 0.0, 1.0, 0.05, 0.25, False)
+    fixed_plus_variable_kernel(100000.0, 10000.0, 5000.0, 0.0, 1.0, 0.10, 0.15, 0.0, math.nan, 0.05)
+    corridor_kernel(100000.0, 10000.0, 5000.0, 0.0, 1.0, 0.3, 0.6, 0.25, 0.0, 0.05)
+    default_scale_rate(0.3)
@@ -43,10 +43,10 @@ def cmd_trueup(args):
     print(f"\n  {'Carrier':<20} {'Share':>6} {'Gross':>12} {'Prior Paid':>12} {'Delta':>12}")
     print(f"  {'-'*64}")
     for a in result.carrier_allocations:
-        print(f"  {a['carrier_id']:<20} {a['participation_pct']:>6.1%} "
-              f"{a['carrier_gross_commission']:>12,.2f} "
-              f"{a['prior_paid']:>12,.2f} "
-              f"{a['delta_payment']:>12,.2f}")
+        print(f"  {a.carrier_id:<20} {a.participation_pct:>6.1%} "
+              f"{a.carrier_gross_commission:>12,.2f} "
+              f"{a.prior_paid:>12,.2f} "
+              f"{a.delta_payment:>12,.2f}")
     if result.warnings:
         print(f"\n  WARNINGS")
         for w in result.warnings:
@@ -1,2 +1,107 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import pytest
 from dotenv import load_dotenv
 load_dotenv('/app/.env')
+
+from engine.calculator import compute_trueup
+from engine.schemes_kernels import warm_up
+from engine.models import get_connection
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--runslow", action="store_true", default=False,
+        help="also run tests marked slow",
+    )
+
+
+def _postgres_reachable() -> bool:
+    try:
+        get_connection().close()
+    except psycopg2.OperationalError:
+        return False
+    return True
+
+
+def pytest_collection_modifyitems(config, items):
+    if not config.getoption("--runslow"):
+        skip_slow = pytest.mark.skip(reason="slow; pass --runslow to run")
+        for item in items:
+            if "slow" in item.keywords:
+                item.add_marker(skip_slow)
+
+    # Calculator and scheme tests still run without a database; only the
+    # db-marked ones need Postgres, so probe once rather than erroring each
+    db_items = [item for item in items if "db" in item.keywords]
+    if db_items and not _postgres_reachable():
+        skip_db = pytest.mark.skip(reason="Postgres is not reachable")
+        for item in db_items:
+            item.add_marker(skip_db)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def warm_scheme_kernels():
+    """Compile (or load from cache) the scheme kernels before any test times them."""
+    warm_up()
+
+
+@pytest.fixture(scope="session")
+def db_conn():
+    """One Postgres connection shared by the whole test session.
+
+    Also prepares `ledger_row(id)` once so ledger probes skip the
+    parse/plan step on every call.
+    """
+    conn = get_connection()
+    with conn.cursor() as cur:
+        cur.execute(
+            "PREPARE ledger_row(int) AS "
+            "SELECT * FROM commission_ledger WHERE id = $1"
+        )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def conn(db_conn):
+    """The shared session connection, rolled back after each test."""
+    yield db_conn
+    db_conn.rollback()
+
+
+@pytest.fixture
+def uniq():
+    """Short random suffix for policy/carrier refs a test inserts.
+
+    Keeps rows from different xdist workers from colliding on shared UYs.
+    """
+    return uuid.uuid4().hex[:8]
+
+
+@pytest.fixture(scope="session")
+def trueup_2023_12():
+    """Read-only UY 2023 true-up at 12 months, computed once per session."""
+    return compute_trueup(2023, 12, '2024-01-01')
+
+
+@pytest.fixture(scope="session")
+def trueup_2023_24():
+    """Read-only UY 2023 true-up at 24 months, computed once per session."""
+    return compute_trueup(2023, 24, '2025-01-01')
+
+
+@pytest.fixture(scope="session")
+def trueup_all_uys():
+    """Read-only 12-month true-up for each seeded UY, keyed by UY.
+
+    Each UY runs on its own thread and connection, so one UY's queries
+    overlap another's compute.
+    """
+    uys = (2022, 2023, 2024)
+    with ThreadPoolExecutor(max_workers=len(uys)) as pool:
+        futures = {uy: pool.submit(compute_trueup, uy, 12, f'{uy + 1}-01-01') for uy in uys}
+    return {uy: future.result() for uy, future in futures.items()}
@@ -1,169 +1,295 @@
+import os
+import re
+import numpy as np
 import pytest
 from datetime import date, timedelta
 from engine.calculator import (
     run_trueup, MIN_COMMISSION_RATE, IBNR_STALENESS_DAYS, ULR_DIVERGENCE_THRESHOLD,
-    get_commission_rate
+    get_commission_rate, get_commission_rates, CarrierAllocation
 )
 from engine.schemes import (
     get_scheme_rate, SCHEME_SLIDING_SCALE, SCHEME_CORRIDOR, 
     SCHEME_FIXED_PLUS_VARIABLE, SCHEME_CAPPED_SCALE, SCHEME_CARRIER_SPECIFIC,
     SlidingScaleScheme, FixedPlusVariableScheme, CorridorProfitScheme,
-    CommissionContext
+    CommissionContext, CarrierSplitsError, NoEarnedPremiumError
 )
 from engine.models import (
-    get_connection, get_earned_premium, get_carrier_splits,
+    get_earned_premium, get_carrier_splits,
     get_ibnr, write_commission_record
 )
 
 
-class TestSlidingScale:
-    """Tests for the commission sliding scale."""
-
-    def test_lowest_band(self):
-        assert get_commission_rate(0.30) == 0.27
-
-    def test_second_band(self):
-        assert get_commission_rate(0.50) == 0.23
-
-    def test_third_band(self):
-        assert get_commission_rate(0.60) == 0.18
-
-    def test_fourth_band(self):
-        assert get_commission_rate(0.70) == 0.10
-
-    def test_zero_commission(self):
-        assert get_commission_rate(0.80) == 0.00
-
-    def test_loss_scenario(self):
-        assert get_commission_rate(1.20) == 0.00
-
-    def test_zero_loss_ratio(self):
-        assert get_commission_rate(0.00) == 0.27
-
-    def test_boundary_45(self):
-        assert get_commission_rate(0.45) == 0.23
+# Under pytest-xdist each worker gets its own block of scratch UYs, so
+# parallel tests never collide on seeding or cleanup
+WORKER_UY_OFFSET = int(os.environ.get("PYTEST_XDIST_WORKER", "gw0")[2:]) * 1000
+
+# Underwriting years that exist only for the duration of a test
+UY_SCRATCH_A = 2025 + WORKER_UY_OFFSET
+UY_SCRATCH_B = 2026 + WORKER_UY_OFFSET
+SCRATCH_UYS = (UY_SCRATCH_A, UY_SCRATCH_B)
+
+# Never seeded, for the missing-data failure paths
+UY_MISSING = 9999 + WORKER_UY_OFFSET
+
+# Corridor scheme parameters shared by the dispatch table
+CORRIDOR_PARAMS = {'corridor_min': 0.3, 'corridor_max': 0.6, 'rate_inside': 0.25, 'rate_outside': 0.0}
+
+# run_trueup's carrier-vs-MGU warning, matched in one scan per string
+_ULR_DIV_RE = re.compile(r'ULR.*divergence|divergence.*ULR')
+_ULR_DIV_RE_ANYCASE = re.compile(_ULR_DIV_RE.pattern, re.IGNORECASE)
+
+# One statement for every scratch-UY table. Default (NO ACTION) foreign
+# keys are only checked at the end of the statement, so deleting
+# uy_cohorts alongside its children in sibling CTEs is safe.
+_CLEANUP_UY_SQL = """
+    PREPARE cleanup_uys(int[]) AS
+    WITH d_ledger AS (DELETE FROM commission_ledger WHERE underwriting_year = ANY($1)),
+         d_ibnr AS (DELETE FROM ibnr_snapshots WHERE underwriting_year = ANY($1)),
+         d_txn AS (DELETE FROM transactions WHERE underwriting_year = ANY($1)),
+         d_pol AS (DELETE FROM policies WHERE underwriting_year = ANY($1)),
+         d_split AS (DELETE FROM carrier_splits WHERE underwriting_year = ANY($1)),
+         d_cs AS (DELETE FROM carrier_schemes WHERE underwriting_year = ANY($1)),
+         d_bcv AS (DELETE FROM baa_contract_versions WHERE underwriting_year = ANY($1)),
+         d_lpt AS (DELETE FROM lpt_events WHERE underwriting_year = ANY($1))
+    DELETE FROM uy_cohorts WHERE underwriting_year = ANY($1)
+"""
+
+_CLEANUP_SCHEMES_SQL = """
+    PREPARE cleanup_schemes(int[]) AS
+    DELETE FROM profit_commission_schemes WHERE scheme_id = ANY($1)
+"""
+
+# Idempotent seeds for scratch UYs. An anti-join on the natural key skips
+# the unique-index conflict path, and carrier_splits has no unique key
+# for ON CONFLICT to act on anyway.
+_SEED_SQL = """
+    PREPARE seed_cohort(int, date, date, text) AS
+    INSERT INTO uy_cohorts (underwriting_year, period_start, period_end, status)
+    SELECT $1, $2, $3, $4
+    WHERE NOT EXISTS (SELECT 1 FROM uy_cohorts WHERE underwriting_year = $1);
+
+    PREPARE seed_policy(text, int, date, date, numeric) AS
+    INSERT INTO policies (policy_ref, underwriting_year, effective_date, expiry_date, gross_premium)
+    SELECT $1, $2, $3, $4, $5
+    WHERE NOT EXISTS (SELECT 1 FROM policies WHERE policy_ref = $1);
+
+    PREPARE seed_split(int, text, text, numeric, date) AS
+    INSERT INTO carrier_splits (underwriting_year, carrier_id, carrier_name, participation_pct, effective_from)
+    SELECT $1, $2, $3, $4, $5
+    WHERE NOT EXISTS (
+        SELECT 1 FROM carrier_splits
+        WHERE underwriting_year = $1 AND carrier_id = $2 AND effective_from = $5
+    );
+
+    PREPARE insert_txn(text, int, text, date, numeric) AS
+    INSERT INTO transactions (policy_ref, underwriting_year, txn_type, txn_date, amount)
+    VALUES ($1, $2, $3, $4, $5);
+"""
+
+
+# Seed statements shared by the mutating tests. The seed_* and insert_txn
+# names are the prepared statements from _SEED_SQL.
+_SQL_SEED_COHORT = "EXECUTE seed_cohort(%s, %s, %s, %s)"
+_SQL_SEED_POLICY = "EXECUTE seed_policy(%s, %s, %s, %s, %s)"
+_SQL_SEED_SPLIT = "EXECUTE seed_split(%s, %s, %s, %s, %s)"
+_SQL_INSERT_TXN = "EXECUTE insert_txn(%s, %s, %s, %s, %s)"
+_SQL_INSERT_IBNR = (
+    "INSERT INTO ibnr_snapshots (underwriting_year, as_of_date, ibnr_amount, source, development_month) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
+_SQL_INSERT_CARRIER_SCHEME = (
+    "INSERT INTO carrier_schemes (underwriting_year, carrier_id, effective_from, scheme_type, parameters_json) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
 
-    def test_boundary_55(self):
-        assert get_commission_rate(0.55) == 0.18
 
-    def test_boundary_65(self):
-        assert get_commission_rate(0.65) == 0.10
+def _execute_script(cur, statements) -> None:
+    """Send (sql, params) pairs to Postgres as one multi-statement round trip."""
+    cur.execute(b';'.join(cur.mogrify(sql, params) for sql, params in statements))
+
+
+def _alloc_array(result, attr: str) -> np.ndarray:
+    """One float64 array of a CarrierAllocation attribute across all carriers."""
+    allocs = result.carrier_allocations
+    return np.fromiter((getattr(a, attr) for a in allocs), dtype=np.float64, count=len(allocs))
+
+
+def _cents(amount: float) -> int:
+    """Money as integer cents, so equality checks are exact."""
+    return int(round(amount * 100))
+
+
+def _seq_scanned_relations(plan) -> list:
+    """Relations read by a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan."""
+    found = []
+    stack = [plan[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        if node['Node Type'] == 'Seq Scan':
+            found.append(node['Relation Name'])
+        stack.extend(node.get('Plans', []))
+    return found
+
+
+def _assert_no_seqscan(cur, sql: str, params=None) -> None:
+    """
+    Fail if the planner cannot reach every table in `sql` through an index.
+
+    Sequential scans are disabled for the current transaction, so any Seq
+    Scan left in the plan means no usable index exists. Scratch tables are
+    tiny, and without this the planner would pick a seq scan anyway.
+    """
+    cur.execute("SET LOCAL enable_seqscan = off")
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    seq_scanned = _seq_scanned_relations(cur.fetchone()['QUERY PLAN'])
+    assert not seq_scanned, f"Sequential scan on {seq_scanned}"
+
+
+def _fetch_ledger_row(cur, ledger_id: int):
+    """Fetch one commission_ledger row via the session's `ledger_row` statement."""
+    cur.execute("EXECUTE ledger_row(%s)", (ledger_id,))
+    return cur.fetchone()
+
+
+@pytest.fixture(scope="module")
+def scratch_statements(db_conn):
+    """Prepare the seed and scratch-UY cleanup statements once per module."""
+    with db_conn.cursor() as cur:
+        cur.execute(_SEED_SQL)
+        cur.execute(_CLEANUP_UY_SQL)
+        cur.execute(_CLEANUP_SCHEMES_SQL)
+    db_conn.commit()
+    yield
+    with db_conn.cursor() as cur:
+        for name in ('seed_cohort', 'seed_policy', 'seed_split', 'insert_txn',
+                     'cleanup_uys', 'cleanup_schemes'):
+            cur.execute(f"DEALLOCATE {name}")
+    db_conn.commit()
+
+
+@pytest.fixture
+def scratch_uy_cleanup(db_conn, scratch_statements):
+    """
+    Purge the scratch UYs after the test, even if an assertion failed.
+
+    Yields a list; append any profit_commission_schemes ids the test
+    created so they are removed once the contract versions are gone.
+    """
+    scheme_ids = []
+    yield scheme_ids
+    # Discard anything the test left open (or aborted) before cleaning up
+    db_conn.rollback()
+    with db_conn.cursor() as cur:
+        cur.execute("EXECUTE cleanup_uys(%s)", (list(SCRATCH_UYS),))
+        if scheme_ids:
+            cur.execute("EXECUTE cleanup_schemes(%s)", (scheme_ids,))
+    db_conn.commit()
 
-    def test_boundary_75(self):
-        assert get_commission_rate(0.75) == 0.00
 
+class TestSlidingScale:
+    """Tests for the commission sliding scale."""
 
+    @pytest.mark.parametrize('ulr, expected', [
+        (0.30, 0.27),  # lowest band
+        (0.50, 0.23),  # second band
+        (0.60, 0.18),  # third band
+        (0.70, 0.10),  # fourth band
+        (0.80, 0.00),  # zero commission
+        (1.20, 0.00),  # loss scenario
+        (0.00, 0.27),  # zero loss ratio
+        (0.45, 0.23),  # boundary 45
+        (0.55, 0.18),  # boundary 55
+        (0.65, 0.10),  # boundary 65
+        (0.75, 0.00),  # boundary 75
+    ])
+    def test_band(self, ulr, expected):
+        assert get_commission_rate(ulr) == expected
+
+    def test_default_scale_matches_scheme_bands(self):
+        """The compiled default scale must agree with SlidingScaleScheme.DEFAULT_BANDS."""
+        bands = {'bands': SlidingScaleScheme.DEFAULT_BANDS}
+        for ulr in (0.0, 0.4499, 0.45, 0.5499, 0.55, 0.65, 0.7499, 0.75, 1.0, 5.0):
+            assert get_commission_rate(ulr) == get_commission_rate(ulr, bands)
+
+    def test_array_lookup_matches_scalar(self):
+        """get_commission_rates must match get_commission_rate element-wise."""
+        ulrs = np.array([0.0, 0.3, 0.45, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 1.2])
+        expected = [get_commission_rate(u) for u in ulrs]
+        assert get_commission_rates(ulrs).tolist() == expected
+
+
+@pytest.mark.db
 class TestCarrierSplitVintage:
     """Tests for carrier split vintage selection."""
 
-    def test_carrier_splits_require_as_of_date(self):
+    def test_carrier_splits_require_as_of_date(self, conn):
         """Verify carrier splits are filtered by effective_from <= as_of_date."""
-        conn = get_connection()
-        try:
-            splits = get_carrier_splits(conn, 2024, '2024-06-01')
-            assert len(splits) == 2
-            total_pct = sum(float(s['participation_pct']) for s in splits)
-            assert abs(total_pct - 1.0) < 0.0001
-        finally:
-            conn.close()
+        splits = get_carrier_splits(conn, 2024, '2024-06-01')
+        assert len(splits) == 2
+        total_pct = sum(float(s['participation_pct']) for s in splits)
+        assert total_pct == pytest.approx(1.0, abs=1e-4)
 
-    def test_carrier_splits_all_uys(self):
+    def test_carrier_splits_all_uys(self, conn):
         """Verify carrier splits work for all underwriting years."""
-        conn = get_connection()
-        try:
-            for uy in [2022, 2023, 2024]:
-                splits = get_carrier_splits(conn, uy, f'{uy+1}-01-01')
-                assert len(splits) > 0
-                total_pct = sum(float(s['participation_pct']) for s in splits)
-                assert abs(total_pct - 1.0) < 0.0001
-        finally:
-            conn.close()
-
-    def test_carrier_splits_include_effective_from(self):
+        for uy in [2022, 2023, 2024]:
+            splits = get_carrier_splits(conn, uy, f'{uy+1}-01-01')
+            assert len(splits) > 0
+            total_pct = sum(float(s['participation_pct']) for s in splits)
+            assert total_pct == pytest.approx(1.0, abs=1e-4)
+
+    def test_carrier_splits_include_effective_from(self, conn):
         """Verify carrier splits include effective_from field."""
-        conn = get_connection()
-        try:
-            splits = get_carrier_splits(conn, 2023, '2024-01-01')
-            for split in splits:
-                assert 'effective_from' in split
-                assert split['effective_from'] is not None
-        finally:
-            conn.close()
+        splits = get_carrier_splits(conn, 2023, '2024-01-01')
+        for split in splits:
+            assert 'effective_from' in split
+            assert split['effective_from'] is not None
 
 
+@pytest.mark.db
+@pytest.mark.usefixtures('scratch_statements')
 class TestReturnPremium:
     """Tests for return premium netting."""
 
-    def test_earned_premium_basic(self):
+    def test_earned_premium_basic(self, conn):
         """Verify earned premium calculates correctly without return premium."""
-        conn = get_connection()
-        try:
-            premium = get_earned_premium(conn, 2023, '2025-01-01')
-            assert premium > 0
-        finally:
-            conn.close()
-
-    def test_earned_premium_filters_by_as_of_date(self):
+        premium = get_earned_premium(conn, 2023, '2025-01-01')
+        assert premium > 0
+
+    def test_earned_premium_filters_by_as_of_date(self, conn):
         """Verify earned premium is filtered by as_of_date."""
-        conn = get_connection()
-        try:
-            full = get_earned_premium(conn, 2023, '2025-01-01')
-            partial = get_earned_premium(conn, 2023, '2024-06-01')
-            assert full >= partial
-        finally:
-            conn.close()
-
-    def test_return_premium_reduces_earned(self):
+        full = get_earned_premium(conn, 2023, '2025-01-01')
+        partial = get_earned_premium(conn, 2023, '2024-06-01')
+        assert full >= partial
+
+    def test_return_premium_reduces_earned(self, conn, uniq):
         """Verify return premium reduces earned premium."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO policies (policy_ref, underwriting_year, effective_date, expiry_date, gross_premium)
-                VALUES ('POL-TEST-001', 2024, '2024-01-01', '2024-12-31', 100000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            conn.commit()
-
-            cur.execute("""
-                INSERT INTO transactions (policy_ref, underwriting_year, txn_type, txn_date, amount)
-                VALUES ('POL-TEST-001', 2024, 'return_premium', '2024-06-15', 5000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            conn.commit()
-
-            with_return = get_earned_premium(conn, 2024, '2025-01-01')
-            assert with_return >= 0
-
-            cur.execute("DELETE FROM transactions WHERE policy_ref = 'POL-TEST-001'")
-            cur.execute("DELETE FROM policies WHERE policy_ref = 'POL-TEST-001'")
-            conn.commit()
-        finally:
-            conn.close()
+        cur = conn.cursor()
+        ref = f'POL-TEST-{uniq}'
+        _execute_script(cur, [
+            (_SQL_SEED_POLICY, (ref, 2024, '2024-01-01', '2024-12-31', 100000.00)),
+            (_SQL_INSERT_TXN, (ref, 2024, 'return_premium', '2024-06-15', 5000.00)),
+        ])
+
+        # Read back on the same connection; the fixture rolls the seed back
+        with_return = get_earned_premium(conn, 2024, '2025-01-01')
+        assert with_return >= 0
 
 
+@pytest.mark.db
 class TestIBNROfLogic:
     """Tests for IBNR as-of filtering."""
 
-    def test_ibnr_filters_by_eval_date(self):
+    def test_ibnr_filters_by_eval_date(self, conn):
         """Verify IBNR filters snapshots where as_of_date <= eval_date."""
-        conn = get_connection()
-        try:
-            ibnr = get_ibnr(conn, 2023, 24, 'carrier_official', '2025-01-01')
-            assert ibnr['ibnr_amount'] > 0
-            assert ibnr['development_month'] == 24
-        finally:
-            conn.close()
-
-    def test_ibnr_returns_development_month(self):
+        ibnr = get_ibnr(conn, 2023, 24, 'carrier_official', '2025-01-01')
+        assert ibnr['ibnr_amount'] > 0
+        assert ibnr['development_month'] == 24
+
+    def test_ibnr_returns_development_month(self, conn):
         """Verify IBNR result includes development_month."""
-        conn = get_connection()
-        try:
-            ibnr = get_ibnr(conn, 2023, 24, 'carrier_official', '2025-01-01')
-            assert 'development_month' in ibnr
-            assert ibnr['development_month'] == 24
-        finally:
-            conn.close()
+        ibnr = get_ibnr(conn, 2023, 24, 'carrier_official', '2025-01-01')
+        assert 'development_month' in ibnr
+        assert ibnr['development_month'] == 24
 
     def test_ibnr_stale_warning_triggered(self):
         """Test that stale IBNR triggers warning."""
@@ -172,706 +298,449 @@ class TestIBNROfLogic:
         assert stale_warning_found
 
 
+@pytest.mark.db
+@pytest.mark.usefixtures('scratch_statements')
 class TestFloorGuard:
     """Tests for floor guard behavior."""
 
-    def test_floor_guard_in_severe_loss(self):
+    def test_floor_guard_in_severe_loss(self, conn, uniq):
         """Test floor guard applies in severe loss scenarios."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            
-            # Clear existing UY 2022 transactions to isolate test
-            cur.execute("DELETE FROM transactions WHERE underwriting_year = 2022")
-            cur.execute("DELETE FROM policies WHERE underwriting_year = 2022")
-            conn.commit()
-            
-            # Insert isolated severe loss scenario
-            cur.execute("""
-                INSERT INTO policies (policy_ref, underwriting_year, effective_date, expiry_date, gross_premium)
-                VALUES ('POL-LOSS-001', 2022, '2022-01-01', '2022-12-31', 100000.00)
-            """)
-            conn.commit()
-
-            cur.execute("""
-                INSERT INTO transactions (policy_ref, underwriting_year, txn_type, txn_date, amount)
-                VALUES ('POL-LOSS-001', 2022, 'premium', '2022-01-01', 100000.00),
-                       ('POL-LOSS-001', 2022, 'claim_paid', '2022-06-01', 5000000.00)
-            """)
-            conn.commit()
-
-            result = run_trueup(2022, 12, '2023-01-01', write_to_db=False)
-            
-            # With massive claims (5000% loss ratio), sliding scale commission should be 0%
-            # but floor guard should apply to guarantee minimum 5%
-            assert result.floor_guard_applied == True
-            # Check that carriers got minimum commission despite 0% rate
-            for alloc in result.carrier_allocations:
-                assert alloc['commission_rate'] == 0.0
-                assert alloc['delta_payment'] > 0  # Floor guard gave them something
-
-            # Restore seed data for UY 2022
-            cur.execute("DELETE FROM transactions WHERE policy_ref = 'POL-LOSS-001'")
-            cur.execute("DELETE FROM policies WHERE policy_ref = 'POL-LOSS-001'")
-            
-            # Re-insert seed policies for UY 2022
-            import random
-            from datetime import date, timedelta
-            random.seed(42)
-            for i in range(1, 11):
-                ref = f'POL-2022-{i:03d}'
-                eff = date(2022, random.randint(1,11), 1)
-                exp = date(2023, eff.month, 1)
-                premium = round(random.uniform(80_000, 600_000), 2)
-                cur.execute(
-                    '''INSERT INTO policies (policy_ref,underwriting_year,effective_date,expiry_date,gross_premium) 
-                       VALUES (%s, 2022, %s, %s, %s)''',
-                    (ref, eff, exp, premium)
-                )
-                cur.execute(
-                    '''INSERT INTO transactions (policy_ref,underwriting_year,txn_type,txn_date,amount) 
-                       VALUES (%s, 2022, 'premium', %s, %s)''',
-                    (ref, eff, premium)
-                )
-                if random.random() < 0.40:
-                    claim_amt = round(premium * random.uniform(0.2, 0.9), 2)
-                    claim_date = eff + timedelta(days=random.randint(90, 900))
-                    cur.execute(
-                        '''INSERT INTO transactions (policy_ref,underwriting_year,txn_type,txn_date,amount) 
-                           VALUES (%s, 2022, 'claim_paid', %s, %s)''',
-                        (ref, claim_date, claim_amt)
-                    )
-            conn.commit()
-        finally:
-            conn.close()
-
-    def test_floor_guard_guarantees_minimum_commission(self):
+        cur = conn.cursor()
+        ref = f'POL-LOSS-{uniq}'
+
+        # Clear existing UY 2022 business and insert an isolated severe loss
+        # scenario, in one round trip
+        _execute_script(cur, [
+            ("DELETE FROM transactions WHERE underwriting_year = %s", (2022,)),
+            ("DELETE FROM policies WHERE underwriting_year = %s", (2022,)),
+            (_SQL_SEED_POLICY, (ref, 2022, '2022-01-01', '2022-12-31', 100000.00)),
+            (_SQL_INSERT_TXN, (ref, 2022, 'premium', '2022-01-01', 100000.00)),
+            (_SQL_INSERT_TXN, (ref, 2022, 'claim_paid', '2022-06-01', 5000000.00)),
+        ])
+        # Nothing is committed: run_trueup reads the scenario through this
+        # connection and the rollback fixture restores the UY 2022 seed, so
+        # parallel workers never see the deleted cohort
+        result = run_trueup(2022, 12, '2023-01-01', write_to_db=False, conn=conn)
+
+        # With massive claims (5000% loss ratio), sliding scale commission should be 0%
+        # but floor guard should apply to guarantee minimum 5%
+        assert result.floor_guard_applied == True
+        # Check that carriers got minimum commission despite 0% rate
+        assert np.all(_alloc_array(result, 'commission_rate') == 0.0)
+        assert np.all(_alloc_array(result, 'delta_payment') > 0)  # Floor guard gave them something
+
+    def test_floor_guard_guarantees_minimum_commission(self, trueup_2023_24):
         """Test that floor guard guarantees minimum commission rate."""
-        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
+        result = trueup_2023_24
         
         min_comm = result.earned_premium * MIN_COMMISSION_RATE
-        
-        for alloc in result.carrier_allocations:
-            expected_min = min_comm * alloc['participation_pct']
-            actual = alloc['prior_paid'] + alloc['delta_payment']
-            assert actual >= expected_min * 0.99
+
+        expected_min = min_comm * _alloc_array(result, 'participation_pct')
+        actual = _alloc_array(result, 'prior_paid') + _alloc_array(result, 'delta_payment')
+        assert np.all(actual >= expected_min * 0.99)
 
 
+@pytest.mark.db
+@pytest.mark.usefixtures('scratch_uy_cleanup')
 class TestULRDivergence:
     """Tests for carrier vs MGU ULR divergence warning."""
 
-    def test_ulr_divergence_warning_present(self):
+    def test_ulr_divergence_warning_present(self, conn):
         """Test that ULR divergence warning triggers when > 10%."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            
-            # First setup: create UY cohort and premium for 2025
-            cur.execute("""
-                INSERT INTO uy_cohorts (underwriting_year, period_start, period_end, status)
-                VALUES (2025, '2025-01-01', '2025-12-31', 'open')
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO policies (policy_ref, underwriting_year, effective_date, expiry_date, gross_premium)
-                VALUES ('POL-2025-001', 2025, '2025-01-01', '2025-12-31', 500000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO transactions (policy_ref, underwriting_year, txn_type, txn_date, amount)
-                VALUES ('POL-2025-001', 2025, 'premium', '2025-01-01', 500000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            # Create carrier splits
-            cur.execute("""
-                INSERT INTO carrier_splits (underwriting_year, carrier_id, carrier_name, participation_pct, effective_from)
-                VALUES (2025, 'CAR_A', 'Atlas Specialty', 0.70, '2025-01-01'),
-                       (2025, 'CAR_C', 'Crown Markets', 0.30, '2025-01-01')
-                ON CONFLICT DO NOTHING
-            """)
-            # Create high divergence IBNR
-            cur.execute("""
-                INSERT INTO ibnr_snapshots 
-                    (underwriting_year, as_of_date, ibnr_amount, source, development_month)
-                VALUES (2025, '2026-01-01', 2000000, 'carrier_official', 12)
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO ibnr_snapshots 
-                    (underwriting_year, as_of_date, ibnr_amount, source, development_month)
-                VALUES (2025, '2026-01-01', 10000, 'mgu_internal', 12)
-                ON CONFLICT DO NOTHING
-            """)
-            conn.commit()
-            
-            result = run_trueup(2025, 12, '2026-01-01', write_to_db=True)
-            
-            # Assert warning is present
-            div_warning = any('ULR' in w and 'divergence' in w for w in result.warnings)
-            assert div_warning, f"Expected divergence warning in warnings: {result.warnings}"
-            
-            # Assert ulr_divergence_flag is True in ledger
-            cur.execute("""
-                SELECT ulr_divergence_flag FROM commission_ledger 
-                WHERE underwriting_year = 2025 AND carrier_id = 'CAR_A'
-                ORDER BY id DESC LIMIT 1
-            """)
-            row = cur.fetchone()
-            assert row is not None, "Ledger entry not found"
-            assert row['ulr_divergence_flag'] == True, "Expected ulr_divergence_flag = True"
-            
-            # Cleanup
-            cur.execute("DELETE FROM commission_ledger WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM ibnr_snapshots WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM transactions WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM policies WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM carrier_splits WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM uy_cohorts WHERE underwriting_year = 2025")
-            conn.commit()
-        finally:
-            conn.close()
-
-    def test_ulr_divergence_warning_string(self):
+        cur = conn.cursor()
+        uy, ref = UY_SCRATCH_A, f'POL-{UY_SCRATCH_A}-001'
+
+        # UY cohort and premium for 2025, carrier splits and high
+        # divergence IBNR, in one round trip
+        _execute_script(cur, [
+            (_SQL_SEED_COHORT, (uy, '2025-01-01', '2025-12-31', 'open')),
+            (_SQL_SEED_POLICY, (ref, uy, '2025-01-01', '2025-12-31', 500000.00)),
+            (_SQL_INSERT_TXN, (ref, uy, 'premium', '2025-01-01', 500000.00)),
+            (_SQL_SEED_SPLIT, (uy, 'CAR_A', 'Atlas Specialty', 0.70, '2025-01-01')),
+            (_SQL_SEED_SPLIT, (uy, 'CAR_C', 'Crown Markets', 0.30, '2025-01-01')),
+            (_SQL_INSERT_IBNR, (uy, '2026-01-01', 2000000, 'carrier_official', 12)),
+            (_SQL_INSERT_IBNR, (uy, '2026-01-01', 10000, 'mgu_internal', 12)),
+        ])
+        # Single commit for the whole seed batch: run_trueup reads it
+        # through its own connection
+        conn.commit()
+
+        result = run_trueup(UY_SCRATCH_A, 12, '2026-01-01', write_to_db=True)
+
+        # Assert warning is present
+        div_warning = any(_ULR_DIV_RE.search(w) for w in result.warnings)
+        assert div_warning, f"Expected divergence warning in warnings: {result.warnings}"
+
+        # Assert ulr_divergence_flag is True in ledger
+        row = _fetch_ledger_row(cur, result.ledger_ids['CAR_A'])
+        assert row is not None, "Ledger entry not found"
+        assert row['ulr_divergence_flag'] == True, "Expected ulr_divergence_flag = True"
+
+    def test_ulr_divergence_warning_string(self, conn):
         """Test that divergence warning contains both 'ULR' and 'divergence'."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            
-            # Setup UY 2026 with data
-            cur.execute("""
-                INSERT INTO uy_cohorts (underwriting_year, period_start, period_end, status)
-                VALUES (2026, '2026-01-01', '2026-12-31', 'open')
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO policies (policy_ref, underwriting_year, effective_date, expiry_date, gross_premium)
-                VALUES ('POL-2026-001', 2026, '2026-01-01', '2026-12-31', 500000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO transactions (policy_ref, underwriting_year, txn_type, txn_date, amount)
-                VALUES ('POL-2026-001', 2026, 'premium', '2026-01-01', 500000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO carrier_splits (underwriting_year, carrier_id, carrier_name, participation_pct, effective_from)
-                VALUES (2026, 'CAR_A', 'Atlas Specialty', 0.70, '2026-01-01'),
-                       (2026, 'CAR_C', 'Crown Markets', 0.30, '2026-01-01')
-                ON CONFLICT DO NOTHING
-            """)
-            # Create high divergence IBNR
-            cur.execute("""
-                INSERT INTO ibnr_snapshots 
-                    (underwriting_year, as_of_date, ibnr_amount, source, development_month)
-                VALUES (2026, '2027-01-01', 1500000, 'carrier_official', 12)
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO ibnr_snapshots 
-                    (underwriting_year, as_of_date, ibnr_amount, source, development_month)
-                VALUES (2026, '2027-01-01', 5000, 'mgu_internal', 12)
-                ON CONFLICT DO NOTHING
-            """)
-            conn.commit()
-            
-            result = run_trueup(2026, 12, '2027-01-01', write_to_db=True)
-            
-            # Assert warning string contains both "ULR" and "divergence"
-            div_warning_found = False
-            for w in result.warnings:
-                if 'ULR' in w.upper() and 'divergence' in w.lower():
-                    div_warning_found = True
-                    break
-            
-            assert div_warning_found, f"Expected warning containing 'ULR' and 'divergence': {result.warnings}"
-            
-            # Cleanup
-            cur.execute("DELETE FROM commission_ledger WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM ibnr_snapshots WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM transactions WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM policies WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM carrier_splits WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM uy_cohorts WHERE underwriting_year = 2026")
-            conn.commit()
-        finally:
-            conn.close()
+        cur = conn.cursor()
+        uy, ref = UY_SCRATCH_B, f'POL-{UY_SCRATCH_B}-001'
 
+        # Setup UY 2026 with high divergence IBNR, in one round trip
+        _execute_script(cur, [
+            (_SQL_SEED_COHORT, (uy, '2026-01-01', '2026-12-31', 'open')),
+            (_SQL_SEED_POLICY, (ref, uy, '2026-01-01', '2026-12-31', 500000.00)),
+            (_SQL_INSERT_TXN, (ref, uy, 'premium', '2026-01-01', 500000.00)),
+            (_SQL_SEED_SPLIT, (uy, 'CAR_A', 'Atlas Specialty', 0.70, '2026-01-01')),
+            (_SQL_SEED_SPLIT, (uy, 'CAR_C', 'Crown Markets', 0.30, '2026-01-01')),
+            (_SQL_INSERT_IBNR, (uy, '2027-01-01', 1500000, 'carrier_official', 12)),
+            (_SQL_INSERT_IBNR, (uy, '2027-01-01', 5000, 'mgu_internal', 12)),
+        ])
+        conn.commit()
 
+        result = run_trueup(UY_SCRATCH_B, 12, '2027-01-01', write_to_db=True)
+
+        # Assert warning string contains both "ULR" and "divergence"
+        div_warning_found = any(_ULR_DIV_RE_ANYCASE.search(w) for w in result.warnings)
+
+        assert div_warning_found, f"Expected warning containing 'ULR' and 'divergence': {result.warnings}"
+
+
+@pytest.mark.db
 class TestBandCrossing:
     """Tests for band-crossing retroaction."""
 
-    def test_band_crossing_recomputation(self):
+    def test_band_crossing_recomputation(self, trueup_2023_12, trueup_2023_24):
         """Test that crossing bands triggers correct retroactive recompute."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            
-            # First run at dev 12 (good band)
-            result_12 = run_trueup(2023, 12, '2024-01-01', write_to_db=False)
-            
-            # Then run at dev 24 (potentially worse band due to more claims)
-            result_24 = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
-            
-            # Verify both run successfully
-            assert result_12.earned_premium > 0
-            assert result_24.earned_premium > 0
-            
-            # The ULR should generally increase over time as more claims emerge
-            assert result_24.ultimate_loss_ratio >= result_12.ultimate_loss_ratio * 0.5  # At least half as much
-            
-        finally:
-            conn.close()
+        # Dev 12 (good band), then dev 24 (potentially worse band due to more claims)
+        result_12 = trueup_2023_12
+        result_24 = trueup_2023_24
 
+        # Verify both run successfully
+        assert result_12.earned_premium > 0
+        assert result_24.earned_premium > 0
 
+        # The ULR should generally increase over time as more claims emerge
+        assert result_24.ultimate_loss_ratio >= result_12.ultimate_loss_ratio * 0.5  # At least half as much
+
+
+@pytest.mark.db
 class TestTrueUpNoDb:
     """Core true-up calculation tests."""
 
-    def test_basic_calculation_runs(self):
-        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
+    def test_basic_calculation_runs(self, trueup_2023_24):
+        result = trueup_2023_24
         assert result.earned_premium > 0
         assert result.ultimate_loss_ratio >= 0
 
-    def test_carrier_allocations_sum_to_gross(self):
-        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
-        total = sum(a['carrier_gross_commission'] for a in result.carrier_allocations)
-        assert abs(total - result.gross_commission) < 0.01
+    def test_carrier_allocations_sum_to_gross(self, trueup_2023_24):
+        result = trueup_2023_24
+        total = _alloc_array(result, 'carrier_gross_commission').sum()
+        assert total == pytest.approx(result.gross_commission, abs=0.01)
 
-    def test_ulr_formula_correct(self):
-        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
+    def test_ulr_formula_correct(self, trueup_2023_24):
+        result = trueup_2023_24
         expected = (result.paid_claims + result.ibnr_carrier) / result.earned_premium
-        assert abs(result.ultimate_loss_ratio - expected) < 0.000001
+        assert result.ultimate_loss_ratio == pytest.approx(expected, abs=1e-6)
 
-    def test_all_three_underwriting_years(self):
-        for uy in [2022, 2023, 2024]:
-            result = run_trueup(uy, 12, f'{uy+1}-01-01', write_to_db=False)
-            assert result.earned_premium > 0
+    def test_all_three_underwriting_years(self, trueup_all_uys):
+        for uy, result in trueup_all_uys.items():
+            assert result.earned_premium > 0, f"UY {uy}"
 
-    def test_development_month_from_ibnr_snapshot(self):
+    def test_development_month_from_ibnr_snapshot(self, trueup_2023_24):
         """Verify development_month comes from IBNR snapshot."""
-        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
+        result = trueup_2023_24
         assert result.development_month == 24
 
-    def test_carrier_split_vintage_in_result(self):
+    def test_carrier_split_vintage_in_result(self, trueup_2023_24):
         """Verify carrier split vintage info is captured."""
-        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
+        result = trueup_2023_24
         assert len(result.carrier_allocations) > 0
         for alloc in result.carrier_allocations:
-            assert 'carrier_id' in alloc
-            assert 'participation_pct' in alloc
-            assert 'scheme_type' in alloc
+            assert isinstance(alloc, CarrierAllocation)
+            assert alloc.carrier_id
+            assert alloc.scheme_type
 
 
+@pytest.mark.db
 class TestLedgerWrite:
     """Tests for commission ledger writing."""
 
-    def test_ledger_includes_vintage_fields(self):
+    def test_ledger_includes_vintage_fields(self, conn, uniq):
         """Verify ledger write includes carrier_split_effective_from and carrier_split_pct."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            write_commission_record(conn, {
-                'underwriting_year': 2024,
-                'carrier_id': 'CAR_TEST',
-                'development_month': 12,
-                'as_of_date': '2025-01-01',
-                'earned_premium': 100000.00,
-                'paid_claims': 10000.00,
-                'ibnr_amount': 5000.00,
-                'ultimate_loss_ratio': 0.15,
-                'commission_rate': 0.27,
-                'gross_commission': 27000.00,
-                'prior_paid_total': 0.00,
-                'delta_payment': 27000.00,
-                'floor_guard_applied': False,
-                'calc_type': 'true_up',
-                'carrier_split_effective_from': '2024-01-01',
-                'carrier_split_pct': 0.70,
-                'ibnr_stale_days': 0,
-                'ulr_divergence_flag': False,
-                'scheme_type_used': 'sliding_scale',
-            })
-
-            cur.execute("""
-                SELECT carrier_split_effective_from, carrier_split_pct
-                FROM commission_ledger
-                WHERE carrier_id = 'CAR_TEST' AND underwriting_year = 2024
-                ORDER BY id DESC LIMIT 1
-            """)
-            row = cur.fetchone()
-            assert row is not None
-            assert str(row['carrier_split_effective_from']) == '2024-01-01'
-            assert float(row['carrier_split_pct']) == 0.70
-
-            cur.execute("DELETE FROM commission_ledger WHERE carrier_id = 'CAR_TEST'")
-            conn.commit()
-        finally:
-            conn.close()
+        cur = conn.cursor()
+        ledger_id = write_commission_record(conn, {
+            'underwriting_year': 2024,
+            'carrier_id': f'CAR_{uniq}',
+            'development_month': 12,
+            'as_of_date': '2025-01-01',
+            'earned_premium': 100000.00,
+            'paid_claims': 10000.00,
+            'ibnr_amount': 5000.00,
+            'ultimate_loss_ratio': 0.15,
+            'commission_rate': 0.27,
+            'gross_commission': 27000.00,
+            'prior_paid_total': 0.00,
+            'delta_payment': 27000.00,
+            'floor_guard_applied': False,
+            'calc_type': 'true_up',
+            'carrier_split_effective_from': '2024-01-01',
+            'carrier_split_pct': 0.70,
+            'ibnr_stale_days': 0,
+            'ulr_divergence_flag': False,
+            'scheme_type_used': 'sliding_scale',
+        })
+
+        row = _fetch_ledger_row(cur, ledger_id)
+        assert row is not None
+        assert str(row['carrier_split_effective_from']) == '2024-01-01'
+        assert float(row['carrier_split_pct']) == 0.70
 
 
 class TestSchemeEngine:
     """Tests for the profit commission scheme engine."""
 
-    def test_scheme_dispatch_sliding_scale(self):
-        rate = get_scheme_rate(SCHEME_SLIDING_SCALE, 0.40, None, {})
-        assert rate == 0.27
-
-    def test_scheme_dispatch_corridor(self):
-        params = {'corridor_min': 0.3, 'corridor_max': 0.6, 'rate_inside': 0.25, 'rate_outside': 0.0}
-        rate = get_scheme_rate(SCHEME_CORRIDOR, 0.45, None, params)
-        assert rate == 0.25
-
-    def test_scheme_dispatch_corridor_outside(self):
-        params = {'corridor_min': 0.3, 'corridor_max': 0.6, 'rate_inside': 0.25, 'rate_outside': 0.0}
-        rate = get_scheme_rate(SCHEME_CORRIDOR, 0.70, None, params)
-        assert rate == 0.0
+    @pytest.mark.parametrize('scheme, ulr, params, expected', [
+        (SCHEME_SLIDING_SCALE, 0.40, {}, 0.27),
+        (SCHEME_CORRIDOR, 0.45, CORRIDOR_PARAMS, 0.25),  # inside corridor
+        (SCHEME_CORRIDOR, 0.70, CORRIDOR_PARAMS, 0.0),   # outside corridor
+    ])
+    def test_scheme_dispatch(self, scheme, ulr, params, expected):
+        assert get_scheme_rate(scheme, ulr, None, params) == expected
 
 
+@pytest.mark.db
 class TestMultipleVintages:
     """Tests for carrier split vintage selection."""
 
-    def test_multiple_vintages_selects_latest(self):
+    def test_multiple_vintages_selects_latest(self, conn):
         """Test that window function selects latest row per carrier."""
-        conn = get_connection()
-        try:
-            splits = get_carrier_splits(conn, 2024, '2025-01-01')
-            assert len(splits) == 2
-            carrier_ids = [s['carrier_id'] for s in splits]
-            assert len(set(carrier_ids)) == 2
-            assert 'CAR_A' in carrier_ids
-            assert 'CAR_C' in carrier_ids
-        finally:
-            conn.close()
+        splits = get_carrier_splits(conn, 2024, '2025-01-01')
+        assert len(splits) == 2
+        carrier_ids = [s['carrier_id'] for s in splits]
+        assert len(set(carrier_ids)) == 2
+        assert 'CAR_A' in carrier_ids
+        assert 'CAR_C' in carrier_ids
 
 
+@pytest.mark.db
 class TestLPTFreeze:
     """Tests for LPT (Loss Portfolio Transfer) freeze logic."""
 
-    def test_lpt_freeze_stops_commission(self):
+    def test_lpt_freeze_stops_commission(self, conn):
         """Test that LPT event freezes commission."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO lpt_events (underwriting_year, carrier_id, effective_date, freeze_commission)
-                VALUES (2023, 'CAR_A', '2024-01-01', TRUE)
-            """)
-            conn.commit()
-
-            result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
-            car_a_alloc = [a for a in result.carrier_allocations if a['carrier_id'] == 'CAR_A'][0]
-            assert car_a_alloc.get('frozen', False) == True
-            assert car_a_alloc['delta_payment'] == 0
-
-            cur.execute("DELETE FROM lpt_events WHERE carrier_id = 'CAR_A' AND underwriting_year = 2023")
-            conn.commit()
-        finally:
-            conn.close()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO lpt_events (underwriting_year, carrier_id, effective_date, freeze_commission)
+            VALUES (2023, 'CAR_A', '2024-01-01', TRUE)
+        """)
+
+        # Uncommitted, so other workers reading UY 2023 never see the freeze
+        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False, conn=conn)
+        car_a_alloc = result.carrier_allocations_by_id['CAR_A']
+        assert car_a_alloc.frozen == True
+        assert car_a_alloc.delta_payment == 0
 
 
+@pytest.mark.db
+@pytest.mark.usefixtures('scratch_uy_cleanup')
 class TestCarrierSchemeLookup:
     """Tests for get_carrier_scheme function."""
 
-    def test_get_carrier_scheme_from_carrier_schemes_table(self):
+    def test_get_carrier_scheme_from_carrier_schemes_table(self, conn):
         """Test that carrier scheme is looked up from carrier_schemes table."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            
-            # Setup UY 2025 (not in seed data)
-            cur.execute("""
-                INSERT INTO uy_cohorts (underwriting_year, period_start, period_end, status)
-                VALUES (2025, '2025-01-01', '2025-12-31', 'open')
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO policies (policy_ref, underwriting_year, effective_date, expiry_date, gross_premium)
-                VALUES ('POL-TEST-001', 2025, '2025-01-01', '2025-12-31', 100000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO transactions (policy_ref, underwriting_year, txn_type, txn_date, amount)
-                VALUES ('POL-TEST-001', 2025, 'premium', '2025-01-01', 100000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO carrier_splits (underwriting_year, carrier_id, carrier_name, participation_pct, effective_from)
-                VALUES (2025, 'CAR_A', 'Atlas Specialty', 1.0, '2025-01-01')
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO ibnr_snapshots (underwriting_year, as_of_date, ibnr_amount, source, development_month)
-                VALUES (2025, '2026-01-01', 10000, 'carrier_official', 12),
-                       (2025, '2026-01-01', 10000, 'mgu_internal', 12)
-                ON CONFLICT DO NOTHING
-            """)
-            conn.commit()
-            
-            # Insert carrier_schemes entry
-            cur.execute("""
-                INSERT INTO carrier_schemes (underwriting_year, carrier_id, effective_from, scheme_type, parameters_json)
-                VALUES (2025, 'CAR_A', '2025-01-01', 'corridor_profit', 
-                    '{"floor": 0.03, "ceiling": 0.15, "corridor_min": 0.40, "corridor_max": 0.60}')
-            """)
-            
-            conn.commit()
-            
-            # Run trueup and check that scheme_type_used matches
-            result = run_trueup(2025, 12, '2026-01-01', write_to_db=True)
-            
-            # Check that the ledger has the correct scheme_type_used
-            cur.execute("""
-                SELECT scheme_type_used FROM commission_ledger 
-                WHERE underwriting_year = 2025 AND carrier_id = 'CAR_A'
-                ORDER BY id DESC LIMIT 1
-            """)
-            row = cur.fetchone()
-            assert row is not None, "No ledger entry found"
-            assert row['scheme_type_used'] == 'corridor_profit', f"Expected 'corridor_profit', got '{row['scheme_type_used']}'"
-            
-            # Cleanup
-            cur.execute("DELETE FROM carrier_schemes WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM commission_ledger WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM ibnr_snapshots WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM carrier_splits WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM transactions WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM policies WHERE underwriting_year = 2025")
-            cur.execute("DELETE FROM uy_cohorts WHERE underwriting_year = 2025")
-            conn.commit()
-        finally:
-            conn.close()
-
-    def test_get_carrier_scheme_fallback_to_contract_version(self):
+        cur = conn.cursor()
+        uy, ref = UY_SCRATCH_A, f'POL-{UY_SCRATCH_A}-T01'
+
+        # Setup UY 2025 (not in seed data) plus its carrier_schemes entry,
+        # in one round trip
+        _execute_script(cur, [
+            (_SQL_SEED_COHORT, (uy, '2025-01-01', '2025-12-31', 'open')),
+            (_SQL_SEED_POLICY, (ref, uy, '2025-01-01', '2025-12-31', 100000.00)),
+            (_SQL_INSERT_TXN, (ref, uy, 'premium', '2025-01-01', 100000.00)),
+            (_SQL_SEED_SPLIT, (uy, 'CAR_A', 'Atlas Specialty', 1.0, '2025-01-01')),
+            (_SQL_INSERT_IBNR, (uy, '2026-01-01', 10000, 'carrier_official', 12)),
+            (_SQL_INSERT_IBNR, (uy, '2026-01-01', 10000, 'mgu_internal', 12)),
+            (_SQL_INSERT_CARRIER_SCHEME, (
+                uy, 'CAR_A', '2025-01-01', 'corridor_profit',
+                '{"floor": 0.03, "ceiling": 0.15, "corridor_min": 0.40, "corridor_max": 0.60}',
+            )),
+        ])
+        # Single commit: run_trueup reads the seed through its own connection
+        conn.commit()
+
+        # Run trueup and check that scheme_type_used matches
+        result = run_trueup(UY_SCRATCH_A, 12, '2026-01-01', write_to_db=True)
+
+        # Check that the ledger has the correct scheme_type_used
+        row = _fetch_ledger_row(cur, result.ledger_ids['CAR_A'])
+        assert row is not None, "No ledger entry found"
+        assert row['scheme_type_used'] == 'corridor_profit', f"Expected 'corridor_profit', got '{row['scheme_type_used']}'"
+
+    def test_get_carrier_scheme_fallback_to_contract_version(self, conn, scratch_uy_cleanup):
         """Test fallback to baa_contract_versions when no carrier_schemes entry."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            
-            # Setup UY 2026 (not in seed data)
-            cur.execute("""
-                INSERT INTO uy_cohorts (underwriting_year, period_start, period_end, status)
-                VALUES (2026, '2026-01-01', '2026-12-31', 'open')
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO policies (policy_ref, underwriting_year, effective_date, expiry_date, gross_premium)
-                VALUES ('POL-TEST-002', 2026, '2026-01-01', '2026-12-31', 100000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO transactions (policy_ref, underwriting_year, txn_type, txn_date, amount)
-                VALUES ('POL-TEST-002', 2026, 'premium', '2026-01-01', 100000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO carrier_splits (underwriting_year, carrier_id, carrier_name, participation_pct, effective_from)
-                VALUES (2026, 'CAR_A', 'Atlas Specialty', 1.0, '2026-01-01')
-                ON CONFLICT DO NOTHING
-            """)
-            cur.execute("""
-                INSERT INTO ibnr_snapshots (underwriting_year, as_of_date, ibnr_amount, source, development_month)
-                VALUES (2026, '2027-01-01', 10000, 'carrier_official', 12),
-                       (2026, '2027-01-01', 10000, 'mgu_internal', 12)
-                ON CONFLICT DO NOTHING
-            """)
-            
-            # Insert a profit commission scheme definition
-            cur.execute("""
+        cur = conn.cursor()
+        seed = {'uy': UY_SCRATCH_B, 'ref': f'POL-{UY_SCRATCH_B}-T02'}
+
+        # Whole scenario in one round trip: scratch UY 2026 seed, then a
+        # corridor scheme chained into a contract version (no carrier_schemes
+        # entry). The cursor is left on the last statement's RETURNING row.
+        cur.execute("""
+            EXECUTE seed_cohort(%(uy)s, '2026-01-01', '2026-12-31', 'open');
+            EXECUTE seed_policy(%(ref)s, %(uy)s, '2026-01-01', '2026-12-31', 100000.00);
+            INSERT INTO transactions (policy_ref, underwriting_year, txn_type, txn_date, amount)
+            VALUES (%(ref)s, %(uy)s, 'premium', '2026-01-01', 100000.00);
+            EXECUTE seed_split(%(uy)s, 'CAR_A', 'Atlas Specialty', 1.0, '2026-01-01');
+            INSERT INTO ibnr_snapshots (underwriting_year, as_of_date, ibnr_amount, source, development_month)
+            VALUES (%(uy)s, '2027-01-01', 10000, 'carrier_official', 12),
+                   (%(uy)s, '2027-01-01', 10000, 'mgu_internal', 12);
+            WITH scheme AS (
                 INSERT INTO profit_commission_schemes (name, scheme_type, parameters_json)
-                VALUES ('Corridor Profit Test', 'corridor_profit', 
+                VALUES ('Corridor Profit Test', 'corridor_profit',
                     '{"floor": 0.03, "ceiling": 0.15, "corridor_min": 0.40, "corridor_max": 0.60}')
                 RETURNING scheme_id
-            """)
-            result = cur.fetchone()
-            scheme_id = result['scheme_id']
-            
-            # Insert baa_contract_versions entry with scheme_id (no carrier_schemes entry)
-            cur.execute("""
-                INSERT INTO baa_contract_versions (underwriting_year, version_number, effective_from, scheme_id)
-                VALUES (2026, 1, '2026-01-01', %s)
-            """, (scheme_id,))
-            
-            conn.commit()
-            
-            # Run trueup and check that scheme_type_used matches
-            result = run_trueup(2026, 12, '2027-01-01', write_to_db=True)
-            
-            # Check that the ledger has the correct scheme_type_used
-            cur.execute("""
-                SELECT scheme_type_used FROM commission_ledger 
-                WHERE underwriting_year = 2026
-                ORDER BY id DESC LIMIT 1
-            """)
-            row = cur.fetchone()
-            assert row is not None, "No ledger entry found"
-            assert row['scheme_type_used'] == 'corridor_profit', f"Expected 'corridor_profit', got '{row['scheme_type_used']}'"
-            
-            # Cleanup
-            cur.execute("DELETE FROM baa_contract_versions WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM profit_commission_schemes WHERE scheme_id = %s", (scheme_id,))
-            cur.execute("DELETE FROM commission_ledger WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM ibnr_snapshots WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM carrier_splits WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM transactions WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM policies WHERE underwriting_year = 2026")
-            cur.execute("DELETE FROM uy_cohorts WHERE underwriting_year = 2026")
-            conn.commit()
-        finally:
-            conn.close()
+            )
+            INSERT INTO baa_contract_versions (underwriting_year, version_number, effective_from, scheme_id)
+            SELECT %(uy)s, 1, '2026-01-01', scheme_id FROM scheme
+            RETURNING scheme_id;
+        """, seed)
+        scratch_uy_cleanup.append(cur.fetchone()['scheme_id'])
+
+        conn.commit()
+
+        # Run trueup and check that scheme_type_used matches
+        result = run_trueup(UY_SCRATCH_B, 12, '2027-01-01', write_to_db=True)
 
+        # Check that the ledger has the correct scheme_type_used
+        row = _fetch_ledger_row(cur, result.ledger_ids['CAR_A'])
+        assert row is not None, "No ledger entry found"
+        assert row['scheme_type_used'] == 'corridor_profit', f"Expected 'corridor_profit', got '{row['scheme_type_used']}'"
 
+
+@pytest.mark.db
+class TestScratchCleanup:
+    """Guards on the scratch-UY cleanup statement."""
+
+    def test_cleanup_uses_indexes(self, conn, scratch_statements):
+        """Every table purged by cleanup_uys must be reachable by index."""
+        cur = conn.cursor()
+        _assert_no_seqscan(cur, "EXECUTE cleanup_uys(%s)", (list(SCRATCH_UYS),))
+
+
+@pytest.mark.db
 class TestNegativeCommission:
     """Tests for negative commission handling."""
 
-    def test_negative_commission_disallowed_by_default(self):
+    def test_negative_commission_disallowed_by_default(self, trueup_2023_24):
         """Test that negative commission is disallowed by default."""
-        conn = get_connection()
-        try:
-            result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
-            for alloc in result.carrier_allocations:
-                assert alloc['delta_payment'] >= 0
-        finally:
-            conn.close()
+        result = trueup_2023_24
+        assert np.all(_alloc_array(result, 'delta_payment') >= 0)
 
 
+@pytest.mark.db
+@pytest.mark.usefixtures('scratch_statements')
 class TestCarrierSplitFailures:
     """Tests for carrier split failure scenarios."""
 
-    def test_missing_splits_raises_error(self):
+    def test_missing_splits_raises_error(self, conn):
         """Missing carrier splits must raise CarrierSplitsError."""
-        from engine.schemes import CarrierSplitsError
-        conn = get_connection()
-        try:
-            # Use a non-existent UY that has no splits
-            with pytest.raises(CarrierSplitsError):
-                get_carrier_splits(conn, 9999, '2025-01-01')
-        finally:
-            conn.close()
-
-    def test_splits_not_sum_to_one_raises_error(self):
+        # Use a non-existent UY that has no splits
+        with pytest.raises(CarrierSplitsError):
+            get_carrier_splits(conn, UY_MISSING, '2025-01-01')
+
+    def test_splits_not_sum_to_one_raises_error(self, conn):
         """Carrier splits not summing to 1.0 must raise CarrierSplitsError."""
-        from engine.schemes import CarrierSplitsError
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            # First add the UY cohort if not exists
-            cur.execute("""
-                INSERT INTO uy_cohorts (underwriting_year, period_start, period_end, status)
-                VALUES (2025, '2025-01-01', '2025-12-31', 'open')
-                ON CONFLICT DO NOTHING
-            """)
-            conn.commit()
-            
-            # Add a test carrier with invalid split
-            cur.execute("""
-                INSERT INTO carrier_splits (underwriting_year, carrier_id, carrier_name, participation_pct, effective_from)
-                VALUES (2025, 'CAR_A', 'Atlas Specialty', 0.5, '2025-01-01')
-                ON CONFLICT DO NOTHING
-            """)
-            conn.commit()
-            
-            with pytest.raises(CarrierSplitsError):
-                get_carrier_splits(conn, 2025, '2025-06-01')
-            
-            # Cleanup
-            cur.execute("DELETE FROM carrier_splits WHERE underwriting_year = 2025")
-            conn.commit()
-        finally:
-            conn.close()
+        cur = conn.cursor()
+        seed = {'uy': UY_SCRATCH_A}
+        # UY cohort plus a single carrier with an invalid split, in one round trip
+        cur.execute("""
+            EXECUTE seed_cohort(%(uy)s, '2025-01-01', '2025-12-31', 'open');
+            EXECUTE seed_split(%(uy)s, 'CAR_A', 'Atlas Specialty', 0.5, '2025-01-01');
+        """, seed)
+
+        with pytest.raises(CarrierSplitsError):
+            get_carrier_splits(conn, UY_SCRATCH_A, '2025-06-01')
 
 
+@pytest.mark.db
 class TestIBNRFailures:
     """Tests for IBNR failure scenarios."""
 
     def test_missing_carrier_ibnr_raises_error(self):
         """Missing carrier IBNR must raise domain error (or no earned premium first)."""
-        from engine.schemes import NoEarnedPremiumError, NoIBNRSnapshotError
-        # With UY 9999, it will fail on earned premium first (no data)
+        # With an unseeded UY, it will fail on earned premium first (no data)
         with pytest.raises(NoEarnedPremiumError):
-            run_trueup(9999, 12, '2025-01-01', write_to_db=False)
+            run_trueup(UY_MISSING, 12, '2025-01-01', write_to_db=False)
 
-    def test_missing_mgu_ibnr_uses_zero(self):
+    def test_missing_mgu_ibnr_uses_zero(self, trueup_2023_24):
         """Missing MGU IBNR should use zero with warning."""
-        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
+        result = trueup_2023_24
         assert result.earned_premium > 0
 
 
+@pytest.mark.db
+@pytest.mark.usefixtures('scratch_statements')
 class TestULRDivergenceScenario:
     """Tests for ULR divergence warning."""
 
-    def test_ulr_divergence_warning_triggers(self):
+    def test_ulr_divergence_warning_triggers(self, conn, uniq):
         """ULR divergence > 10% must trigger warning."""
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            # Add a policy with claims to create high loss ratio
-            cur.execute("""
-                INSERT INTO policies (policy_ref, underwriting_year, effective_date, expiry_date, gross_premium)
-                VALUES ('POL-DIV-001', 2024, '2024-01-01', '2024-12-31', 1000000.00)
-                ON CONFLICT DO NOTHING
-            """)
-            conn.commit()
-            
-            # Add huge claims to push ULR high
-            cur.execute("""
-                INSERT INTO transactions (policy_ref, underwriting_year, txn_type, txn_date, amount)
-                VALUES ('POL-DIV-001', 2024, 'claim_paid', '2024-06-01', 800000.00)
-            """)
-            conn.commit()
-            
-            result = run_trueup(2024, 12, '2025-01-01', write_to_db=False)
-            
-            # Check for ULR divergence warning
-            div_warning = any('ULR' in w and 'divergence' in w for w in result.warnings)
-            # The warning depends on carrier vs MGU IBNR difference
-            # At minimum, verify calculation completed
-            assert result.ultimate_loss_ratio > 0
-            
-            # Cleanup
-            cur.execute("DELETE FROM transactions WHERE policy_ref = 'POL-DIV-001'")
-            cur.execute("DELETE FROM policies WHERE policy_ref = 'POL-DIV-001'")
-            conn.commit()
-        finally:
-            conn.close()
+        cur = conn.cursor()
+        ref = f'POL-DIV-{uniq}'
+        # A policy with huge claims to push ULR high, in one round trip
+        _execute_script(cur, [
+            (_SQL_SEED_POLICY, (ref, 2024, '2024-01-01', '2024-12-31', 1000000.00)),
+            (_SQL_INSERT_TXN, (ref, 2024, 'claim_paid', '2024-06-01', 800000.00)),
+        ])
 
+        result = run_trueup(2024, 12, '2025-01-01', write_to_db=False, conn=conn)
 
+        # Check for ULR divergence warning
+        div_warning = any(_ULR_DIV_RE.search(w) for w in result.warnings)
+        # The warning depends on carrier vs MGU IBNR difference
+        # At minimum, verify calculation completed
+        assert result.ultimate_loss_ratio > 0
+
+
+@pytest.mark.db
+@pytest.mark.slow
 class TestAuditReproducibility:
-    """Tests for audit reproducibility."""
+    """
+    End-to-end audit reproducibility: a ledger write followed by a read-only
+    re-run against it.
+
+    The zero-delta arithmetic itself is unit tested in test_schemes.py.
+    """
 
-    def test_re_run_produces_zero_delta(self):
+    def test_re_run_produces_zero_delta(self, conn):
         """Re-running same true-up should produce zero delta."""
-        conn = get_connection()
-        try:
-            # First run with DB write
-            result1 = run_trueup(2023, 24, '2025-01-01', write_to_db=True)
-            
-            # Second run should produce zero delta (no change)
-            result2 = run_trueup(2023, 24, '2025-01-01', write_to_db=True)
-            
-            # Delta should be zero or very small (accumulated rounding)
-            for alloc2 in result2.carrier_allocations:
-                assert abs(alloc2['delta_payment']) < 0.01, f"Delta should be ~0 for {alloc2['carrier_id']}"
-            
-            # Verify gross commission matches
-            assert abs(result2.gross_commission - result1.gross_commission) < 0.01
-            
-            # Cleanup test data
-            cur = conn.cursor()
-            cur.execute("DELETE FROM commission_ledger WHERE underwriting_year = 2023 AND as_of_date = '2025-01-01' AND carrier_id IN ('CAR_A', 'CAR_B', 'CAR_C')")
-            conn.commit()
-        finally:
-            conn.close()
+        # First run with DB write
+        result1 = run_trueup(2023, 24, '2025-01-01', write_to_db=True, conn=conn)
+
+        # Re-run only reads prior_paid back from the ledger; it need not persist
+        result2 = run_trueup(2023, 24, '2025-01-01', write_to_db=False, conn=conn)
+
+        # Delta must round to zero cents; check every carrier at once so a
+        # failure reports all of them
+        carrier_ids = np.array([a.carrier_id for a in result2.carrier_allocations])
+        deltas = np.fromiter(
+            (a.delta_payment for a in result2.carrier_allocations),
+            dtype=np.float64, count=len(carrier_ids),
+        )
+        delta_cents = np.rint(deltas * 100).astype(np.int64)
+        off = delta_cents != 0
+        assert not off.any(), f"Delta cents should be 0 for {dict(zip(carrier_ids[off].tolist(), delta_cents[off].tolist()))}"
+
+        # Verify gross commission matches to the cent
+        assert _cents(result2.gross_commission) == _cents(result1.gross_commission)
 
 
+@pytest.mark.db
 class TestEffectiveCommissionRate:
     """Tests for correct commission_rate computation."""
 
-    def test_commission_rate_is_effective_rate(self):
+    def test_commission_rate_is_effective_rate(self, trueup_2023_24):
         """commission_rate should be total_gross / earned_premium, not ULR."""
-        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
+        result = trueup_2023_24
         
         # commission_rate should NOT equal ULR
         assert result.commission_rate != result.ultimate_loss_ratio
         
         # commission_rate should equal gross_commission / earned_premium
         expected_rate = result.gross_commission / result.earned_premium
-        assert abs(result.commission_rate - expected_rate) < 0.0001
+        assert result.commission_rate == pytest.approx(expected_rate, abs=1e-4)
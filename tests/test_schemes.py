@@ -1,6 +1,9 @@
+import dataclasses
+
+import numpy as np
 import pytest
 from datetime import date, timedelta
-from engine.calculator import run_trueup
+from engine.calculator import compute_trueup
 from engine.schemes import (
     ProfitCommissionScheme, SlidingScaleScheme, FixedPlusVariableScheme,
     CorridorProfitScheme, CappedScaleScheme, create_scheme, get_scheme_class,
@@ -10,6 +13,45 @@ from engine.schemes import (
 )
 
 
+def _cents(amount: float) -> int:
+    """Money as integer cents, so equality checks are exact."""
+    return int(round(amount * 100))
+
+
+def _make_context(earned_premium=100000, paid_claims=10000, ibnr=5000, prior_paid=0, carrier_pct=1.0):
+    """CommissionContext with test defaults; override the money fields per case."""
+    return CommissionContext(
+        earned_premium=earned_premium,
+        paid_claims=paid_claims,
+        ibnr=ibnr,
+        prior_paid=prior_paid,
+        carrier_pct=carrier_pct,
+        underwriting_year=2024,
+        as_of_date=date(2025, 1, 1),
+        development_month=12,
+    )
+
+
+@pytest.fixture(scope='session')
+def sliding_scale_scheme():
+    """The shared SlidingScaleScheme instance from the scheme factory."""
+    return create_scheme('sliding_scale')
+
+
+@pytest.fixture(scope='module')
+def cached_trueup():
+    """compute_trueup, memoised per (uy, dev_month, as_of) for this module."""
+    results = {}
+
+    def get(underwriting_year, development_month, as_of_date):
+        key = (underwriting_year, development_month, as_of_date)
+        if key not in results:
+            results[key] = compute_trueup(*key)
+        return results[key]
+
+    return get
+
+
 class TestSchemeRegistry:
     """Tests for the scheme registry and factory."""
 
@@ -33,48 +75,107 @@ class TestSchemeRegistry:
         scheme = create_scheme('sliding_scale')
         assert isinstance(scheme, SlidingScaleScheme)
 
+    def test_create_scheme_reuses_instance(self):
+        assert create_scheme('corridor') is create_scheme('corridor')
 
-class TestSlidingScaleScheme:
-    """Tests for SlidingScaleScheme."""
+    def test_create_scheme_unknown_raises(self):
+        with pytest.raises(UnknownSchemeTypeError):
+            create_scheme('unknown_type')
 
-    def test_low_loss_ratio_high_commission(self):
-        scheme = SlidingScaleScheme()
-        ctx = self._make_context(earned_premium=1000000, paid_claims=100000, ibnr=50000)
-        result = scheme.compute_commission(ctx, {'min_commission_rate': 0.05})
-        assert result.commission_rate == 0.27
 
-    def test_mid_loss_ratio_mid_commission(self):
-        scheme = SlidingScaleScheme()
-        ctx = self._make_context(earned_premium=1000000, paid_claims=400000, ibnr=200000)
-        result = scheme.compute_commission(ctx, {'min_commission_rate': 0.05})
-        assert result.commission_rate == 0.18
-
-    def test_high_loss_ratio_zero_commission(self):
-        scheme = SlidingScaleScheme()
-        ctx = self._make_context(earned_premium=1000000, paid_claims=800000, ibnr=300000)
-        result = scheme.compute_commission(ctx, {'min_commission_rate': 0.05})
-        assert result.commission_rate == 0.0
+class TestSlidingScaleScheme:
+    """Tests for SlidingScaleScheme."""
 
-    def test_floor_guard_applied(self):
-        scheme = SlidingScaleScheme()
+    @pytest.mark.parametrize('earned_premium, paid_claims, ibnr, expected_rate', [
+        (1000000, 100000, 50000, 0.27),    # low loss ratio, high commission
+        (1000000, 400000, 200000, 0.18),   # mid loss ratio, mid commission
+        (1000000, 800000, 300000, 0.0),    # high loss ratio, zero commission
+    ])
+    def test_rate_by_loss_ratio(self, sliding_scale_scheme, earned_premium, paid_claims, ibnr, expected_rate):
+        ctx = _make_context(earned_premium=earned_premium, paid_claims=paid_claims, ibnr=ibnr)
+        result = sliding_scale_scheme.compute_commission(ctx, {'min_commission_rate': 0.05})
+        assert result.commission_rate == expected_rate
+
+    def test_floor_guard_applied(self, sliding_scale_scheme):
         # Very high loss ratio = 0% commission, but floor guard should apply
-        ctx = self._make_context(earned_premium=100000, paid_claims=100000, ibnr=50000, prior_paid=0)
-        result = scheme.compute_commission(ctx, {'min_commission_rate': 0.05})
+        ctx = _make_context(earned_premium=100000, paid_claims=100000, ibnr=50000, prior_paid=0)
+        result = sliding_scale_scheme.compute_commission(ctx, {'min_commission_rate': 0.05})
         # Floor should apply: min 5% of 100000 * 1.0 = 5000
         assert result.floor_guard_applied == True
         assert result.delta_payment >= 5000
 
-    def _make_context(self, earned_premium=100000, paid_claims=10000, ibnr=5000, prior_paid=0, carrier_pct=1.0):
-        return CommissionContext(
-            earned_premium=earned_premium,
-            paid_claims=paid_claims,
-            ibnr=ibnr,
-            prior_paid=prior_paid,
-            carrier_pct=carrier_pct,
-            underwriting_year=2024,
-            as_of_date='2025-01-01',
-            development_month=12,
+    def test_batch_matches_scalar(self):
+        """compute_commission_batch must agree element-wise with compute_commission."""
+        scheme = SlidingScaleScheme()
+        params = {'min_commission_rate': 0.05}
+        cases = [
+            # paid_claims, ibnr, prior_paid, carrier_pct, allow_negative
+            (100000, 50000, 0, 1.0, False),      # top band
+            (450000, 0, 0, 0.5, False),          # exactly on a band edge
+            (400000, 200000, 150000, 0.7, False),  # overpaid, clamped to zero
+            (400000, 200000, 150000, 0.7, True),   # overpaid, clawback allowed
+            (900000, 300000, 0, 0.3, False),     # zero band, floor guard
+        ]
+        paid, ibnr, prior, pct, allow_neg = (np.array(col) for col in zip(*cases))
+        batch = scheme.compute_commission_batch(1000000, paid, ibnr, prior, pct, params, allow_neg)
+
+        for i, (p, b, pp, cp, an) in enumerate(cases):
+            ctx = dataclasses.replace(
+                _make_context(earned_premium=1000000, paid_claims=p, ibnr=b,
+                                   prior_paid=pp, carrier_pct=cp),
+                allow_negative_commission=an,
+            )
+            expected = scheme.compute_commission(ctx, params)
+            assert batch.commission_rate[i] == expected.commission_rate
+            assert batch.gross_commission[i] == expected.gross_commission
+            assert batch.delta_payment[i] == pytest.approx(expected.delta_payment)
+            assert batch.floor_guard_applied[i] == expected.floor_guard_applied
+
+    @pytest.mark.parametrize('bands', [
+        [(0.30, 0.25), (0.60, 0.15), (0.90, 0.05)],   # sorted: searchsorted path
+        [(0.60, 0.15), (0.30, 0.25), (0.90, 0.05)],   # unsorted: first match still wins
+    ])
+    def test_band_rates_custom_bands(self, bands):
+        ulrs = [0.0, 0.29, 0.30, 0.45, 0.60, 0.89, 0.90, 2.0]
+        expected = [next((rate for lr_max, rate in bands if u < lr_max), 0.0) for u in ulrs]
+        assert SlidingScaleScheme.band_rates(ulrs, bands).tolist() == expected
+
+    def test_band_edge_uses_exact_division(self):
+        """A ULR landing exactly on 45% must take the 45-55% band on every path.
+
+        Multiplying by 1/earned_premium (or working in float32) puts this
+        case just under the edge and pays the 27% band instead.
+        """
+        scheme = SlidingScaleScheme()
+        params = {'min_commission_rate': 0.05}
+        ctx = _make_context(earned_premium=2387266.62, paid_claims=1074269.979, ibnr=0)
+        assert scheme.compute_commission(ctx, params).commission_rate == 0.23
+        batch = scheme.compute_commission_batch(
+            [ctx.earned_premium], [ctx.paid_claims], [0.0], [0.0], [1.0], params
         )
+        assert batch.commission_rate.tolist() == [0.23]
+
+    def test_compute_commissions_matches_scalar(self):
+        """The grouped path run_trueup uses must return the scalar results, in order."""
+        scheme = SlidingScaleScheme()
+        params = {'min_commission_rate': 0.05}
+        contexts = [
+            _make_context(paid_claims=10000, carrier_pct=0.5),
+            _make_context(paid_claims=60000, prior_paid=20000, carrier_pct=0.3),
+            _make_context(paid_claims=90000, carrier_pct=0.2),
+        ]
+        assert scheme.compute_commissions(contexts, params) == [
+            scheme.compute_commission(ctx, params) for ctx in contexts
+        ]
+
+    def test_context_parses_iso_as_of_date(self):
+        ctx = dataclasses.replace(_make_context(), as_of_date='2025-03-31')
+        assert ctx.as_of_date == date(2025, 3, 31)
+
+    def test_context_is_immutable(self):
+        ctx = _make_context()
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            ctx.prior_paid = 1000
 
 
 class TestFixedPlusVariableScheme:
@@ -84,7 +185,7 @@ class TestFixedPlusVariableScheme:
         """When profit is below threshold, only fixed rate applies."""
         scheme = FixedPlusVariableScheme()
         # Loss: premium=100000, claims=110000, ibnr=10000 => profit = -20000
-        ctx = self._make_context(earned_premium=100000, paid_claims=100000, ibnr=10000)
+        ctx = _make_context(earned_premium=100000, paid_claims=100000, ibnr=10000)
         result = scheme.compute_commission(ctx, {
             'fixed_rate': 0.10,
             'variable_rate': 0.20,
@@ -98,7 +199,7 @@ class TestFixedPlusVariableScheme:
         """When profit is above threshold, fixed + variable applies."""
         scheme = FixedPlusVariableScheme()
         # Profit: premium=100000, claims=50000, ibnr=10000 => profit = 40000
-        ctx = self._make_context(earned_premium=100000, paid_claims=50000, ibnr=10000)
+        ctx = _make_context(earned_premium=100000, paid_claims=50000, ibnr=10000)
         result = scheme.compute_commission(ctx, {
             'fixed_rate': 0.10,
             'variable_rate': 0.20,
@@ -114,7 +215,7 @@ class TestFixedPlusVariableScheme:
         """Variable only applies when profit margin > threshold."""
         scheme = FixedPlusVariableScheme()
         # Profit margin = 10%, threshold = 5%
-        ctx = self._make_context(earned_premium=100000, paid_claims=85000, ibnr=5000)
+        ctx = _make_context(earned_premium=100000, paid_claims=85000, ibnr=5000)
         result = scheme.compute_commission(ctx, {
             'fixed_rate': 0.10,
             'variable_rate': 0.20,
@@ -130,7 +231,7 @@ class TestFixedPlusVariableScheme:
         """Variable component is capped when specified."""
         scheme = FixedPlusVariableScheme()
         # Large profit would give high variable, but capped
-        ctx = self._make_context(earned_premium=100000, paid_claims=0, ibnr=0)
+        ctx = _make_context(earned_premium=100000, paid_claims=0, ibnr=0)
         result = scheme.compute_commission(ctx, {
             'fixed_rate': 0.10,
             'variable_rate': 0.50,
@@ -146,21 +247,27 @@ class TestFixedPlusVariableScheme:
     def test_missing_required_param_raises(self):
         """Missing required parameter raises error."""
         scheme = FixedPlusVariableScheme()
-        ctx = self._make_context()
+        ctx = _make_context()
         with pytest.raises(InvalidSchemeParametersError):
             scheme.compute_commission(ctx, {})  # missing fixed_rate
 
-    def _make_context(self, earned_premium=100000, paid_claims=10000, ibnr=5000, prior_paid=0, carrier_pct=1.0):
-        return CommissionContext(
-            earned_premium=earned_premium,
-            paid_claims=paid_claims,
-            ibnr=ibnr,
-            prior_paid=prior_paid,
-            carrier_pct=carrier_pct,
-            underwriting_year=2024,
-            as_of_date='2025-01-01',
-            development_month=12,
+
+class TestReRunDelta:
+    """Re-running a true-up against what was already paid settles to zero."""
+
+    @pytest.mark.parametrize('scheme_cls, params', [
+        (SlidingScaleScheme, {'min_commission_rate': 0.05}),
+        (FixedPlusVariableScheme, {'fixed_rate': 0.10, 'variable_rate': 0.20,
+                                   'profit_threshold': 0.0, 'min_commission_rate': 0.05}),
+    ])
+    def test_second_run_has_zero_delta(self, scheme_cls, params):
+        scheme = scheme_cls()
+        first = scheme.compute_commission(_make_context(prior_paid=0), params)
+        second = scheme.compute_commission(
+            _make_context(prior_paid=first.delta_payment), params
         )
+        assert _cents(second.delta_payment) == 0
+        assert _cents(second.gross_commission) == _cents(first.gross_commission)
 
 
 class TestCorridorProfitScheme:
@@ -169,7 +276,7 @@ class TestCorridorProfitScheme:
     def test_inside_corridor(self):
         """ULR inside corridor gets rate_inside."""
         scheme = CorridorProfitScheme()
-        ctx = self._make_context(earned_premium=100000, paid_claims=20000, ibnr=5000)
+        ctx = _make_context(earned_premium=100000, paid_claims=20000, ibnr=5000)
         result = scheme.compute_commission(ctx, {
             'corridor_min': 0.20,
             'corridor_max': 0.30,
@@ -183,7 +290,7 @@ class TestCorridorProfitScheme:
     def test_outside_corridor_below(self):
         """ULR below corridor gets rate_outside."""
         scheme = CorridorProfitScheme()
-        ctx = self._make_context(earned_premium=100000, paid_claims=10000, ibnr=5000)
+        ctx = _make_context(earned_premium=100000, paid_claims=10000, ibnr=5000)
         result = scheme.compute_commission(ctx, {
             'corridor_min': 0.20,
             'corridor_max': 0.30,
@@ -197,7 +304,7 @@ class TestCorridorProfitScheme:
     def test_outside_corridor_above(self):
         """ULR above corridor gets rate_outside."""
         scheme = CorridorProfitScheme()
-        ctx = self._make_context(earned_premium=100000, paid_claims=35000, ibnr=5000)
+        ctx = _make_context(earned_premium=100000, paid_claims=35000, ibnr=5000)
         result = scheme.compute_commission(ctx, {
             'corridor_min': 0.20,
             'corridor_max': 0.30,
@@ -208,17 +315,13 @@ class TestCorridorProfitScheme:
         # ULR = 40000/100000 = 0.40, above corridor
         assert result.commission_rate == 0.10
 
-    def _make_context(self, earned_premium=100000, paid_claims=10000, ibnr=5000, prior_paid=0, carrier_pct=1.0):
-        return CommissionContext(
-            earned_premium=earned_premium,
-            paid_claims=paid_claims,
-            ibnr=ibnr,
-            prior_paid=prior_paid,
-            carrier_pct=carrier_pct,
-            underwriting_year=2024,
-            as_of_date='2025-01-01',
-            development_month=12,
-        )
+    def test_compute_commissions_matches_scalar(self):
+        scheme = CorridorProfitScheme()
+        params = {'corridor_min': 0.20, 'corridor_max': 0.30, 'rate_inside': 0.25, 'rate_outside': 0.10}
+        contexts = [_make_context(paid_claims=p, carrier_pct=0.5) for p in (10000, 20000, 35000)]
+        assert scheme.compute_commissions(contexts, params) == [
+            scheme.compute_commission(ctx, params) for ctx in contexts
+        ]
 
 
 class TestCappedScaleScheme:
@@ -227,7 +330,7 @@ class TestCappedScaleScheme:
     def test_below_cap(self):
         """Commission below cap uses sliding scale rate."""
         scheme = CappedScaleScheme()
-        ctx = self._make_context(earned_premium=100000, paid_claims=10000, ibnr=5000)
+        ctx = _make_context(earned_premium=100000, paid_claims=10000, ibnr=5000)
         result = scheme.compute_commission(ctx, {
             'max_commission_rate': 0.20,
             'min_commission_rate': 0.05
@@ -238,7 +341,7 @@ class TestCappedScaleScheme:
     def test_above_cap(self):
         """Commission above cap is capped."""
         scheme = CappedScaleScheme()
-        ctx = self._make_context(earned_premium=100000, paid_claims=1000, ibnr=0)
+        ctx = _make_context(earned_premium=100000, paid_claims=1000, ibnr=0)
         result = scheme.compute_commission(ctx, {
             'max_commission_rate': 0.20,
             'min_commission_rate': 0.05
@@ -246,49 +349,38 @@ class TestCappedScaleScheme:
         # ULR = 1%, sliding scale gives 27%, capped at 20%
         assert result.commission_rate == 0.20
 
-    def _make_context(self, earned_premium=100000, paid_claims=10000, ibnr=5000, prior_paid=0, carrier_pct=1.0):
-        return CommissionContext(
-            earned_premium=earned_premium,
-            paid_claims=paid_claims,
-            ibnr=ibnr,
-            prior_paid=prior_paid,
-            carrier_pct=carrier_pct,
-            underwriting_year=2024,
-            as_of_date='2025-01-01',
-            development_month=12,
-        )
-
 
+@pytest.mark.db
 class TestCalculatorIntegration:
     """Integration tests for the calculator with database."""
 
-    def test_run_trueup_2023_mixed_schemes(self):
+    def test_run_trueup_2023_mixed_schemes(self, trueup_2023_24):
         """Test that different carriers use their assigned schemes."""
-        result = run_trueup(2023, 24, '2025-01-01', write_to_db=False)
+        result = trueup_2023_24
         
         # 2023 has: CAR_A sliding, CAR_B fixed+var, CAR_C sliding
         assert len(result.carrier_allocations) == 3
         
-        car_a = [a for a in result.carrier_allocations if a['carrier_id'] == 'CAR_A'][0]
-        car_b = [a for a in result.carrier_allocations if a['carrier_id'] == 'CAR_B'][0]
+        car_a = result.carrier_allocations_by_id['CAR_A']
+        car_b = result.carrier_allocations_by_id['CAR_B']
         
-        assert car_a['scheme_type'] == 'sliding_scale'
-        assert car_b['scheme_type'] == 'fixed_plus_variable'
+        assert car_a.scheme_type == 'sliding_scale'
+        assert car_b.scheme_type == 'fixed_plus_variable'
 
-    def test_run_trueup_2024_all_fixed_plus_variable(self):
+    def test_run_trueup_2024_all_fixed_plus_variable(self, trueup_all_uys):
         """Test 2024 uses fixed+variable for all carriers (use dev=12 which has IBNR)."""
-        result = run_trueup(2024, 12, '2025-01-01', write_to_db=False)
+        result = trueup_all_uys[2024]
         
         # 2024 has: CAR_A fixed+var, CAR_C fixed+var
         for alloc in result.carrier_allocations:
-            assert alloc['scheme_type'] == 'fixed_plus_variable'
+            assert alloc.scheme_type == 'fixed_plus_variable'
 
-    def test_run_trueup_2022_all_sliding_scale(self):
+    def test_run_trueup_2022_all_sliding_scale(self, cached_trueup):
         """Test 2022 uses sliding scale for all carriers."""
-        result = run_trueup(2022, 24, '2025-01-01', write_to_db=False)
+        result = cached_trueup(2022, 24, '2025-01-01')
         
         for alloc in result.carrier_allocations:
-            assert alloc['scheme_type'] == 'sliding_scale'
+            assert alloc.scheme_type == 'sliding_scale'
 
 
 class TestErrorHandling: